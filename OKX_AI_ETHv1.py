@@ -12,15 +12,38 @@ AI: Deepseek
 import os
 import time
 import hmac
-import hashlib
 import base64
 import json
+import ssl
 import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
-import re
+from logging.handlers import QueueHandler
+import queue
+import threading
+import atexit
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+try:
+    import websocket  # websocket-client，可选依赖
+except ImportError:
+    websocket = None
+
+try:
+    import httpx  # 可选依赖，配合h2包启用HTTP/2
+except ImportError:
+    httpx = None
+
+try:
+    import orjson  # 更快的JSON编解码，可选依赖
+except ImportError:
+    orjson = None
 
 # ==================== 基础配置 ====================
 OKX_API_KEY = ""
@@ -33,6 +56,33 @@ LEVERAGE = 100
 MIN_ORDER_SIZE = 0.001
 MAX_ORDER_SIZE = 0.010
 AI_FREQUENCY = 300
+AI_CACHE_PRICE_EPSILON = 0.001  # 价格变动小于0.1%且持仓不变时复用上次持有决策
+AI_CACHE_MAX_AGE = 900  # 缓存决策最长复用时间(秒)
+# AI决策格式校验
+DECISION_FIELDS = frozenset({"action", "confidence_level", "reason"})
+POSITION_FIELDS = frozenset({"position_size", "stop_loss_price", "take_profit_price"})
+VALID_ACTIONS = frozenset({"hold", "open_long", "open_short", "close_long", "close_short"})
+VALID_CONFIDENCES = frozenset({"high", "medium", "low"})
+
+# WebSocket推送配置
+WS_PUBLIC_URL = "wss://ws.okx.com:8443/ws/v5/public"
+WS_PRIVATE_URL = "wss://ws.okx.com:8443/ws/v5/private"
+WS_STALE_SECONDS = 30  # 推送数据超过该时间未更新则回退REST
+WS_RECONNECT_DELAY = 5
+
+# HTTP连接池配置
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 8
+HTTP_RETRY = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+# OKX限速: 滑动窗口内最多请求数与最大并发请求数
+OKX_RATE_LIMIT = 20
+OKX_RATE_WINDOW = 2.0
+OKX_MAX_CONCURRENT = 10
+# 账户类查询的短时缓存(秒)，同一周期内重复查询直接复用结果；行情数据不缓存
+ACCOUNT_CACHE_TTL = 2.0
+# 共享TLS上下文: 所有会话共用同一份默认配置，证书只加载一次
+SSL_CTX = ssl.create_default_context()
+HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx is not None else ())
 
 logging.basicConfig(
     level=logging.INFO,
@@ -42,22 +92,123 @@ logger = logging.getLogger()
 
 ERROR_FILE = "baocuo.txt"
 ECHO_FILE = "huixian.txt"
+LOG_FLUSH_INTERVAL = 0.2  # 日志后台批量落盘间隔(秒)
+
+class _BufferedFileHandler(logging.FileHandler):
+    """只写入文件缓冲区，不逐条flush，由后台线程批量落盘；文件在首次写入时才打开"""
+    
+    def emit(self, record: logging.LogRecord):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+# 交易线程只负责入队，文件写入全部由后台刷盘线程完成
+_log_queue = queue.SimpleQueue()
+_log_handlers: Dict[str, logging.Handler] = {}
+_log_flusher: Optional[threading.Thread] = None
+_log_flusher_lock = threading.Lock()
+
+def _create_file_logger(name: str, filename: str, tag: str) -> logging.Logger:
+    """创建写入指定文件的日志器，文件只打开一次，时间戳由logging格式化器缓存"""
+    file_logger = logging.getLogger(name)
+    file_logger.setLevel(logging.INFO)
+    file_logger.propagate = False
+    handler = _BufferedFileHandler(filename, encoding="utf-8", delay=True)
+    handler.setFormatter(logging.Formatter(f'%(asctime)s.%(msecs)03d - {tag}: %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    _log_handlers[name] = handler
+    file_logger.addHandler(QueueHandler(_log_queue))
+    return file_logger
+
+def _drain_log_queue():
+    """取出队列中的全部日志，批量写入对应文件后统一flush"""
+    while True:
+        try:
+            record = _log_queue.get_nowait()
+        except queue.Empty:
+            break
+        _log_handlers[record.name].handle(record)
+    for handler in _log_handlers.values():
+        handler.flush()
+
+def _log_flush_loop():
+    """后台刷盘线程主循环"""
+    while True:
+        time.sleep(LOG_FLUSH_INTERVAL)
+        _drain_log_queue()
+
+def _start_log_flusher():
+    """首次写日志时启动后台刷盘线程，导入模块本身不创建线程"""
+    global _log_flusher
+    with _log_flusher_lock:
+        if _log_flusher is None:
+            _log_flusher = threading.Thread(target=_log_flush_loop, name="log-flusher", daemon=True)
+            _log_flusher.start()
+
+error_logger = _create_file_logger("okx_bot.error", ERROR_FILE, "ERROR")
+echo_logger = _create_file_logger("okx_bot.echo", ECHO_FILE, "ECHO")
+atexit.register(_drain_log_queue)
 
 def write_error(message: str):
     """写入错误信息到报错文件"""
-    try:
-        with open(ERROR_FILE, "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now()} - ERROR: {message}\n")
-    except Exception as e:
-        print(f"无法写入错误文件: {e}")
+    if _log_flusher is None:
+        _start_log_flusher()
+    error_logger.error(message)
 
 def write_echo(message: str):
     """写入回显信息到回显文件"""
+    if _log_flusher is None:
+        _start_log_flusher()
+    echo_logger.info(message)
+
+def json_dumps(obj, indent: bool = False) -> str:
+    """JSON序列化，优先使用orjson，未安装时回退标准库"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(',', ':'))
+
+def json_loads(data):
+    """JSON反序列化，支持str和bytes，优先使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class _SharedSSLAdapter(HTTPAdapter):
+    """使用共享SSL_CTX建立连接的适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = SSL_CTX
+        return super().init_poolmanager(*args, **kwargs)
+
+def create_http_session() -> requests.Session:
+    """创建带连接池的HTTP会话，复用TCP+TLS连接"""
+    session = requests.Session()
+    adapter = _SharedSSLAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=HTTP_RETRY
+    )
+    session.mount("https://", adapter)
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+def create_http2_client():
+    """创建HTTP/2客户端，同一主机的并发请求复用一条连接；httpx或h2不可用时返回None"""
+    if httpx is None:
+        return None
     try:
-        with open(ECHO_FILE, "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now()} - ECHO: {message}\n")
-    except Exception as e:
-        print(f"无法写入回显文件: {e}")
+        return httpx.Client(
+            transport=httpx.HTTPTransport(http2=True, verify=SSL_CTX, retries=HTTP_RETRY.total),
+            limits=httpx.Limits(max_keepalive_connections=HTTP_POOL_CONNECTIONS),
+            headers={'Content-Type': 'application/json'},
+            timeout=10.0
+        )
+    except ImportError:
+        return None
 
 # ==================== 模块1: 信息收集模块 ====================
 class OKXDataCollector:
@@ -67,22 +218,39 @@ class OKXDataCollector:
         self.api_key = api_key
         self.secret = secret
         self.password = password
+        self._secret_bytes = secret.encode('utf-8')  # 签名密钥只编码一次
         self.base_url = "https://www.okx.com"
+        # 优先使用HTTP/2多路复用，不可用时回退requests连接池
+        http2_client = create_http2_client()
+        self.http2 = http2_client is not None
+        self.session = http2_client if self.http2 else create_http_session()
+        # 固定的认证头只设置一次，每次请求仅附带签名和时间戳
+        self.session.headers.update({
+            'OK-ACCESS-KEY': self.api_key,
+            'OK-ACCESS-PASSPHRASE': self.password
+        })
+        self.ws_client = None  # 可选的OKXWebSocketClient，提供推送数据缓存
+        # 客户端限速，请求在本地排队而不是触发交易所429后重试
+        self._request_slots = threading.Semaphore(OKX_MAX_CONCURRENT)
+        self._rate_lock = threading.Lock()
+        self._recent_calls = deque(maxlen=OKX_RATE_LIMIT)
+        # GET结果缓存，键为(endpoint, 参数, 时间桶)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
         
-    def _generate_signature(self, timestamp: str, method: str, request_path: str, body: str = "") -> str:
-        """生成OKX API签名"""
+    def _generate_signature(self, timestamp: str, method: str, request_path: str, body: Union[str, bytes] = "") -> str:
+        """生成OKX API签名，body可直接传入已编码的bytes"""
         try:
             if body is None:
-                body = ""
+                body = b""
+            elif isinstance(body, str):
+                body = body.encode('utf-8')
                 
-            message = timestamp + method.upper() + request_path + body
+            message = f"{timestamp}{method.upper()}{request_path}".encode('utf-8') + body
             
-            mac = hmac.new(
-                bytes(self.secret, encoding='utf-8'),
-                bytes(message, encoding='utf-8'),
-                digestmod='sha256'
-            )
-            signature = base64.b64encode(mac.digest()).decode()
+            # hmac.digest 在C层一次完成HMAC计算，底层走OpenSSL(支持SHA-NI)
+            digest = hmac.digest(self._secret_bytes, message, 'sha256')
+            signature = base64.b64encode(digest).decode()
             return signature
             
         except Exception as e:
@@ -95,58 +263,91 @@ class OKXDataCollector:
         timestamp = now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
         return timestamp
     
-    def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
-        """发送API请求"""
+    def _wait_for_rate_limit(self):
+        """滑动窗口限速：窗口内请求数已满时，等待最早的请求移出窗口"""
+        while True:
+            with self._rate_lock:
+                now = time.monotonic()
+                if len(self._recent_calls) < OKX_RATE_LIMIT or now - self._recent_calls[0] >= OKX_RATE_WINDOW:
+                    self._recent_calls.append(now)
+                    return
+                wait_seconds = OKX_RATE_WINDOW - (now - self._recent_calls[0])
+            time.sleep(wait_seconds)
+    
+    def _make_request(self, method: str, endpoint: str, params: Dict = None, cache_ttl: float = 0) -> Dict:
+        """发送API请求，cache_ttl>0的GET请求在同一时间桶内复用上次结果"""
+        cache_key = None
+        if method.upper() == 'GET' and cache_ttl > 0:
+            cache_key = (endpoint, tuple(sorted((params or {}).items())), int(time.monotonic() // cache_ttl))
+            with self._cache_lock:
+                if cache_key in self._cache:
+                    return self._cache[cache_key]
+        elif method.upper() == 'POST':
+            # 下单/平仓会改变账户状态，清空缓存
+            with self._cache_lock:
+                self._cache.clear()
+        
+        data = self._send_request(method, endpoint, params)
+        
+        if cache_key is not None:
+            with self._cache_lock:
+                # 只保留当前时间桶的结果，避免缓存无限增长
+                for key in [k for k in self._cache if k[0] == endpoint and k[2] != cache_key[2]]:
+                    del self._cache[key]
+                self._cache[cache_key] = data
+        return data
+    
+    def _send_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
+        """签名并发送API请求"""
         try:
-            # 构建请求路径和URL
+            self._wait_for_rate_limit()
             request_path = endpoint
-            url = self.base_url + endpoint
-            
             timestamp = self._get_timestamp()
-            body = ""
+            body = b""
             
-            # 处理GET请求参数
+            # 处理GET请求参数，URL与签名使用同一份编码后的查询串
             if method.upper() == 'GET' and params:
-                query_string = '&'.join([f"{k}={v}" for k, v in params.items()])
-                request_path = endpoint + '?' + query_string
-                url = self.base_url + request_path
+                query_string = urllib.parse.urlencode(params, doseq=True)
+                request_path = f"{endpoint}?{query_string}"
             elif method.upper() == 'POST' and params:
-                body = json.dumps(params, separators=(',', ':'))
+                body = json_dumps(params).encode('utf-8')
+            
+            url = self.base_url + request_path
             
             signature = self._generate_signature(timestamp, method.upper(), request_path, body)
             
             headers = {
-                'OK-ACCESS-KEY': self.api_key,
                 'OK-ACCESS-SIGN': signature,
-                'OK-ACCESS-TIMESTAMP': timestamp,
-                'OK-ACCESS-PASSPHRASE': self.password,
-                'Content-Type': 'application/json'
+                'OK-ACCESS-TIMESTAMP': timestamp
             }
-            
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers, timeout=10)
-            else:
-                response = requests.post(url, headers=headers, data=body, timeout=10)
+
+            with self._request_slots:
+                if method.upper() == 'GET':
+                    response = self.session.get(url, headers=headers, timeout=10)
+                elif self.http2:
+                    response = self.session.post(url, headers=headers, content=body, timeout=10)
+                else:
+                    response = self.session.post(url, headers=headers, data=body, timeout=10)
             
             write_echo(f"API请求: {method} {endpoint} - 状态码: {response.status_code}")
             
             response.raise_for_status()
-            result = response.json()
+            result = json_loads(response.content)
             
             if result['code'] != '0':
                 raise Exception(f"API错误: {result['msg']} (代码: {result['code']})")
                 
             return result['data']
             
-        except requests.exceptions.RequestException as e:
+        except HTTP_ERRORS as e:
             write_error(f"网络请求失败: {e} - URL: {url}")
             raise
         except Exception as e:
             write_error(f"API请求失败: {e}")
             raise
     
-    def get_kline_data(self, symbol: str = SYMBOL, bar: str = "5m", limit: int = 4) -> List[Dict]:
-        """获取K线数据"""
+    def get_kline_data(self, symbol: str = SYMBOL, bar: str = "5m", limit: int = 4) -> Dict:
+        """获取K线数据，按列存储(SoA): timestamp为字符串列表，其余字段为float64数组，索引0为最新K线"""
         try:
             endpoint = "/api/v5/market/candles"
             params = {
@@ -156,19 +357,19 @@ class OKXDataCollector:
             }
             
             data = self._make_request('GET', endpoint, params)
-            klines = []
-            
-            for candle in data:
-                klines.append({
-                    "timestamp": datetime.fromtimestamp(int(candle[0])/1000).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": float(candle[1]),
-                    "high": float(candle[2]),
-                    "low": float(candle[3]),
-                    "close": float(candle[4]),
-                    "volume": float(candle[5])
-                })
-            
-            write_echo(f"获取K线数据成功: {len(klines)}根")
+            
+            # 一次性把OHLCV列转换为二维float64数组，避免逐根K线构造字典
+            values = np.asarray([candle[1:6] for candle in data], dtype=np.float64).reshape(-1, 5)
+            klines = {
+                "timestamp": [datetime.fromtimestamp(int(candle[0])/1000).strftime('%Y-%m-%d %H:%M:%S') for candle in data],
+                "open": values[:, 0],
+                "high": values[:, 1],
+                "low": values[:, 2],
+                "close": values[:, 3],
+                "volume": values[:, 4]
+            }
+            
+            write_echo(f"获取K线数据成功: {len(klines['timestamp'])}根")
             return klines
             
         except Exception as e:
@@ -176,46 +377,41 @@ class OKXDataCollector:
             # 返回模拟数据避免程序中断
             current_time = datetime.now()
             base_price = 3500.0
-            return [
-                {
-                    "timestamp": (current_time - timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price,
-                    "high": base_price + 20,
-                    "low": base_price - 10,
-                    "close": base_price + 5,
-                    "volume": 1500.0
-                },
-                {
-                    "timestamp": (current_time - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 5,
-                    "high": base_price + 25,
-                    "low": base_price - 5,
-                    "close": base_price + 10,
-                    "volume": 1200.0
-                },
-                {
-                    "timestamp": (current_time - timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 10,
-                    "high": base_price + 30,
-                    "low": base_price,
-                    "close": base_price + 8,
-                    "volume": 1800.0
-                },
-                {
-                    "timestamp": current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 8,
-                    "high": base_price + 35,
-                    "low": base_price + 5,
-                    "close": base_price + 12,
-                    "volume": 2000.0
-                }
-            ]
+            return {
+                "timestamp": [
+                    (current_time - timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S'),
+                    (current_time - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M:%S'),
+                    (current_time - timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M:%S'),
+                    current_time.strftime('%Y-%m-%d %H:%M:%S')
+                ],
+                "open": base_price + np.array([0.0, 5.0, 10.0, 8.0]),
+                "high": base_price + np.array([20.0, 25.0, 30.0, 35.0]),
+                "low": base_price + np.array([-10.0, -5.0, 0.0, 5.0]),
+                "close": base_price + np.array([5.0, 10.0, 8.0, 12.0]),
+                "volume": np.array([1500.0, 1200.0, 1800.0, 2000.0])
+            }
+    
+    def _get_ws_snapshot(self, channel: str, symbol: str = SYMBOL):
+        """读取WebSocket推送缓存，未启用或数据过期时返回None"""
+        if self.ws_client is None or symbol != self.ws_client.symbol:
+            return None
+        return self.ws_client.get_latest(channel)
+    
+    def get_realtime_price(self) -> Optional[float]:
+        """获取推送的最新成交价，无可用推送时返回None"""
+        data = self._get_ws_snapshot("tickers")
+        if not data:
+            return None
+        return float(data[0]['last'])
     
     def get_account_balance(self) -> Dict:
         """获取账户余额信息"""
         try:
-            endpoint = "/api/v5/account/balance"
-            data = self._make_request('GET', endpoint)
+            # 优先使用推送缓存，推送与REST返回的data结构一致
+            data = self._get_ws_snapshot("account")
+            if data is None:
+                endpoint = "/api/v5/account/balance"
+                data = self._make_request('GET', endpoint, cache_ttl=ACCOUNT_CACHE_TTL)
             
             if not data:
                 raise Exception("账户数据为空")
@@ -240,9 +436,11 @@ class OKXDataCollector:
     def get_position_info(self, symbol: str = SYMBOL) -> Dict:
         """获取持仓信息"""
         try:
-            endpoint = "/api/v5/account/positions"
-            params = {'instId': symbol}
-            data = self._make_request('GET', endpoint, params)
+            data = self._get_ws_snapshot("positions", symbol)
+            if data is None:
+                endpoint = "/api/v5/account/positions"
+                params = {'instId': symbol}
+                data = self._make_request('GET', endpoint, params, cache_ttl=ACCOUNT_CACHE_TTL)
             
             position_data = {
                 "position_side": "flat",
@@ -275,36 +473,93 @@ class OKXDataCollector:
                 "leverage": LEVERAGE
             }
 
-# ==================== 模块2: AI输入模块 ====================
-class DeepSeekAI:
-    """DeepSeek AI交易决策"""
+class OKXWebSocketClient:
+    """OKX WebSocket订阅：推送更新行情/持仓/账户快照，替代每周期REST轮询"""
     
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.deepseek.com/v1/chat/completions"
+    def __init__(self, data_collector: OKXDataCollector, symbol: str = SYMBOL):
+        self.dc = data_collector
+        self.symbol = symbol
+        self._latest = {}  # channel -> (接收时间, data)
+        self._lock = threading.Lock()
     
-    def get_trading_decision(self, market_data: Dict, account_status: Dict, position_info: Dict) -> Dict:
-        """获取AI交易决策"""
-        try:
-            # 在AI请求前记录账户状态和持仓信息
-            write_echo("=== AI请求账户状态 ===")
-            write_echo(f"可用余额: {account_status['available_OKX']:.6f} USDT")
-            write_echo(f"账户总权益: {account_status['total_equity']:.6f} USDT")
-            write_echo(f"持仓方向: {position_info['position_side']}")
-            write_echo(f"持仓数量: {position_info['position_size']:.6f} ETH")
-            write_echo(f"开仓均价: {position_info['entry_price']:.2f} USDT")
-            write_echo(f"杠杆倍数: {position_info['leverage']}倍")
-            
-            # 构建AI提示词 - 完全保持原版模板
-            prompt = self._build_prompt(market_data, account_status, position_info)
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {self.api_key}'
-            }
-            
-            # 完整的系统提示词 - 完全保持原版
-            system_prompt = """
+    def start(self) -> bool:
+        """启动公共频道和私有频道的后台连接线程"""
+        if websocket is None:
+            write_echo("未安装websocket-client，使用REST轮询")
+            return False
+        
+        public_args = [{"channel": "tickers", "instId": self.symbol}]
+        private_args = [
+            {"channel": "positions", "instType": "SWAP", "instId": self.symbol},
+            {"channel": "account"}
+        ]
+        threading.Thread(target=self._run_forever, args=(WS_PUBLIC_URL, public_args, False),
+                         name="ws-public", daemon=True).start()
+        threading.Thread(target=self._run_forever, args=(WS_PRIVATE_URL, private_args, True),
+                         name="ws-private", daemon=True).start()
+        write_echo("WebSocket订阅已启动")
+        return True
+    
+    def get_latest(self, channel: str, max_age: float = WS_STALE_SECONDS):
+        """返回频道最新推送数据，超过max_age秒未更新则返回None"""
+        with self._lock:
+            entry = self._latest.get(channel)
+        if entry is None or time.monotonic() - entry[0] > max_age:
+            return None
+        return entry[1]
+    
+    def _run_forever(self, url: str, args: List[Dict], private: bool):
+        """保持连接，断线后自动重连"""
+        while True:
+            try:
+                ws_app = websocket.WebSocketApp(
+                    url,
+                    on_open=lambda ws: self._on_open(ws, args, private),
+                    on_message=lambda ws, message: self._on_message(ws, message, args)
+                )
+                ws_app.run_forever(ping_interval=20, ping_timeout=10, sslopt={'context': SSL_CTX})
+            except Exception as e:
+                write_error(f"WebSocket连接异常: {e}")
+            time.sleep(WS_RECONNECT_DELAY)
+    
+    def _on_open(self, ws, args: List[Dict], private: bool):
+        if private:
+            # 私有频道需先登录，签名规则与REST一致
+            timestamp = str(int(time.time()))
+            sign = self.dc._generate_signature(timestamp, 'GET', '/users/self/verify')
+            ws.send(json_dumps({
+                "op": "login",
+                "args": [{
+                    "apiKey": self.dc.api_key,
+                    "passphrase": self.dc.password,
+                    "timestamp": timestamp,
+                    "sign": sign
+                }]
+            }))
+        else:
+            ws.send(json_dumps({"op": "subscribe", "args": args}))
+    
+    def _on_message(self, ws, message: str, args: List[Dict]):
+        if message == 'pong':
+            return
+        msg = json_loads(message)
+        event = msg.get('event')
+        
+        if event == 'login':
+            if msg.get('code') == '0':
+                ws.send(json_dumps({"op": "subscribe", "args": args}))
+            else:
+                write_error(f"WebSocket登录失败: {msg.get('msg')}")
+        elif event == 'error':
+            write_error(f"WebSocket错误: {msg.get('msg')} (代码: {msg.get('code')})")
+        elif 'data' in msg:
+            channel = msg['arg']['channel']
+            with self._lock:
+                self._latest[channel] = (time.monotonic(), msg['data'])
+
+# ==================== 模块2: AI输入模块 ====================
+# 完整的系统提示词 - 完全保持原版，模块加载时构建一次
+SYSTEM_PROMPT = """
 角色定位：你是顶级量化竞技AI交易员，专注于OKX交易所的ETH永续合约交易，并且与其他AI交易员互相竞争
 核心目标：在小资金实盘环境下，通过精准策略在激烈竞争中保持优势并实现稳定盈利
 环境认知：
@@ -355,13 +610,66 @@ class DeepSeekAI:
   }
 }
 """
+
+class DeepSeekAI:
+    """DeepSeek AI交易决策"""
+    
+    # 响应无法解析时返回的保守持有决策的理由，该决策不是AI的真实判断，不能缓存复用
+    PARSE_FAILED_REASON = "AI响应解析失败，采用保守策略"
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.base_url = "https://api.deepseek.com/v1/chat/completions"
+        self.session = create_http_session()
+        self.session.headers.update({'Authorization': f'Bearer {self.api_key}'})
+        # 上次AI决策及对应的市场状态 (价格, 持仓方向, 持仓数量)
+        self._last_decision = None
+        self._last_market_state = None
+        self._last_decision_time = 0.0
+    
+    def _get_cached_decision(self, current_price: float, position_info: Dict) -> Optional[Dict]:
+        """市场状态基本未变且上次决策为持有时返回缓存决策，否则返回None"""
+        if self._last_decision is None or self._last_decision["trading_decision"]["action"] != "hold":
+            return None
+        if time.monotonic() - self._last_decision_time > AI_CACHE_MAX_AGE:
+            return None
+        
+        last_price, last_side, last_size = self._last_market_state
+        if (position_info["position_side"], position_info["position_size"]) != (last_side, last_size):
+            return None
+        if last_price <= 0 or abs(current_price - last_price) / last_price >= AI_CACHE_PRICE_EPSILON:
+            return None
+        return self._last_decision
+    
+    def get_trading_decision(self, market_data: Dict, account_status: Dict, position_info: Dict) -> Dict:
+        """获取AI交易决策"""
+        try:
+            # 在AI请求前记录账户状态和持仓信息
+            write_echo("\n".join([
+                "=== AI请求账户状态 ===",
+                f"可用余额: {account_status['available_OKX']:.6f} USDT",
+                f"账户总权益: {account_status['total_equity']:.6f} USDT",
+                f"持仓方向: {position_info['position_side']}",
+                f"持仓数量: {position_info['position_size']:.6f} ETH",
+                f"开仓均价: {position_info['entry_price']:.2f} USDT",
+                f"杠杆倍数: {position_info['leverage']}倍"
+            ]))
+            
+            current_price = market_data["current_price"]
+            cached_decision = self._get_cached_decision(current_price, position_info)
+            if cached_decision is not None:
+                write_echo("AI决策缓存命中: 市场状态无明显变化，沿用上次持有决策")
+                return cached_decision
+            
+            # 构建AI提示词 - 完全保持原版模板
+            prompt = self._build_prompt(market_data, account_status, position_info)
             
             payload = {
                 "model": "deepseek-chat",
                 "messages": [
                     {
                         "role": "system",
-                        "content": system_prompt
+                        "content": SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -372,32 +680,40 @@ class DeepSeekAI:
                 "max_tokens": 2000
             }
             
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            
-            ai_response = result['choices'][0]['message']['content']
-            write_echo("AI原始响应接收成功")
-            
+            try:
+                ai_response = self._stream_completion(payload)
+            except Exception as e:
+                write_error(f"流式请求失败，回退普通请求: {e}")
+                ai_response = self._fetch_completion(payload)
             # 记录AI原始响应到回显文件以便调试
-            write_echo(f"AI原始响应: {ai_response}")
+            write_echo(f"AI原始响应接收成功\nAI原始响应: {ai_response}")
             
             decision = self._parse_ai_response(ai_response)
             
-            # 记录AI决策详细信息
-            write_echo("=== AI交易决策 ===")
-            write_echo(f"操作类型: {decision['trading_decision']['action']}")
-            write_echo(f"信心等级: {decision['trading_decision']['confidence_level']}")
-            write_echo(f"决策理由: {decision['trading_decision']['reason']}")
-            write_echo(f"建议仓位: {decision['position_management']['position_size']:.6f} ETH")
+            if decision["trading_decision"]["reason"] == self.PARSE_FAILED_REASON:
+                # 解析失败的保守决策不缓存，同时丢弃旧缓存，下个周期重新请求AI
+                self._last_decision = None
+            else:
+                self._last_decision = decision
+                self._last_market_state = (current_price, position_info["position_side"], position_info["position_size"])
+                self._last_decision_time = time.monotonic()
             
+            # 记录AI决策详细信息
             action = decision['trading_decision']['action']
             if action in ['open_long', 'open_short']:
-                write_echo("📈 开仓信号")
+                signal = "📈 开仓信号"
             elif action in ['close_long', 'close_short']:
-                write_echo("📉 平仓信号")
+                signal = "📉 平仓信号"
             else:
-                write_echo("⏸️ 保持持仓")
+                signal = "⏸️ 保持持仓"
+            write_echo("\n".join([
+                "=== AI交易决策 ===",
+                f"操作类型: {action}",
+                f"信心等级: {decision['trading_decision']['confidence_level']}",
+                f"决策理由: {decision['trading_decision']['reason']}",
+                f"建议仓位: {decision['position_management']['position_size']:.6f} ETH",
+                signal
+            ]))
                 
             return decision
             
@@ -417,12 +733,58 @@ class DeepSeekAI:
                 }
             }
     
+    def _fetch_completion(self, payload: Dict) -> str:
+        """普通请求，等待完整响应后返回内容"""
+        response = self.session.post(self.base_url, data=json_dumps(payload).encode('utf-8'), timeout=30)
+        response.raise_for_status()
+        result = json_loads(response.content)
+        return result['choices'][0]['message']['content']
+    
+    def _stream_completion(self, payload: Dict) -> str:
+        """流式请求(SSE)，边接收边检测，收到完整有效的决策JSON后立即停止读取"""
+        body = json_dumps({**payload, "stream": True}).encode('utf-8')
+        parts = []
+        with self.session.post(self.base_url, data=body, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                content = json_loads(data)['choices'][0]['delta'].get('content')
+                if not content:
+                    continue
+                parts.append(content)
+                # 只有出现右括号时才可能形成完整对象
+                if '}' in content and self._has_complete_decision(''.join(parts)):
+                    break
+        
+        if not parts:
+            raise ValueError("流式响应内容为空")
+        return ''.join(parts)
+    
+    def _has_complete_decision(self, text: str) -> bool:
+        """文本中是否已包含一个格式有效的决策JSON"""
+        for json_str in self._iter_json_objects(text):
+            try:
+                if self._validate_decision_format(json_loads(json_str)):
+                    return True
+            except ValueError:
+                continue
+        return False
+    
     def _build_prompt(self, market_data: Dict, account_status: Dict, position_info: Dict) -> str:
         """构建AI输入提示词 - 完全保持原版模板"""
+        # K线按列存储，数组列转为列表后再序列化
+        kline_5min = {
+            key: values.tolist() if isinstance(values, np.ndarray) else values
+            for key, values in market_data["kline_5min"].items()
+        }
         input_data = {
             "market_data": {
                 "current_price": market_data["current_price"],
-                "kline_5min": market_data["kline_5min"]
+                "kline_5min": kline_5min
             },
             "account_status": {
                 "available_OKX": account_status["available_OKX"],
@@ -436,27 +798,23 @@ class DeepSeekAI:
             }
         }
         
-        return json.dumps(input_data, indent=2, ensure_ascii=False)
+        return json_dumps(input_data, indent=True)
 
     def _parse_ai_response(self, response: str) -> Dict:
         """解析AI响应 - 增强解析能力"""
         try:
             # 首先尝试直接解析整个响应
             try:
-                decision = json.loads(response)
+                decision = json_loads(response)
                 if self._validate_decision_format(decision):
                     return decision
             except:
                 pass
             
-            # 如果直接解析失败，尝试提取JSON部分
-            json_pattern = r'\{[^{}]*\{[^{}]*\}[^{}]*\}'  # 匹配嵌套的JSON对象
-            matches = re.finditer(json_pattern, response)
-            
-            for match in matches:
+            # 如果直接解析失败，线性扫描提取完整的JSON对象
+            for json_str in self._iter_json_objects(response):
                 try:
-                    json_str = match.group()
-                    decision = json.loads(json_str)
+                    decision = json_loads(json_str)
                     if self._validate_decision_format(decision):
                         write_echo("从响应中成功提取JSON决策")
                         return decision
@@ -470,7 +828,7 @@ class DeepSeekAI:
             if start_idx != -1 and end_idx != -1:
                 json_str = response[start_idx:end_idx]
                 try:
-                    decision = json.loads(json_str)
+                    decision = json_loads(json_str)
                     if self._validate_decision_format(decision):
                         write_echo("通过边界匹配成功解析JSON决策")
                         return decision
@@ -488,7 +846,7 @@ class DeepSeekAI:
                 "trading_decision": {
                     "action": "hold",
                     "confidence_level": "low",
-                    "reason": "AI响应解析失败，采用保守策略"
+                    "reason": self.PARSE_FAILED_REASON
                 },
                 "position_management": {
                     "position_size": 0,
@@ -497,18 +855,37 @@ class DeepSeekAI:
                 }
             }
     
+    @staticmethod
+    def _iter_json_objects(text: str):
+        """按括号深度线性扫描，依次返回文本中每个完整的顶层JSON对象(O(n)，无正则回溯)"""
+        depth = 0
+        start = -1
+        in_string = False
+        escape = False
+        
+        for i, ch in enumerate(text):
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == '\\':
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                if depth > 0:
+                    in_string = True
+            elif ch == '{':
+                if depth == 0:
+                    start = i
+                depth += 1
+            elif ch == '}' and depth > 0:
+                depth -= 1
+                if depth == 0:
+                    yield text[start:i + 1]
+    
     def _validate_decision_format(self, decision: Dict) -> bool:
         """验证决策格式是否符合模板"""
         try:
-            required_fields = [
-                "trading_decision.action",
-                "trading_decision.confidence_level", 
-                "trading_decision.reason",
-                "position_management.position_size",
-                "position_management.stop_loss_price",
-                "position_management.take_profit_price"
-            ]
-            
             # 检查必需字段是否存在
             if "trading_decision" not in decision or "position_management" not in decision:
                 return False
@@ -516,25 +893,23 @@ class DeepSeekAI:
             td = decision["trading_decision"]
             pm = decision["position_management"]
             
-            if not all(field in td for field in ["action", "confidence_level", "reason"]):
+            if not td.keys() >= DECISION_FIELDS:
                 return False
                 
-            if not all(field in pm for field in ["position_size", "stop_loss_price", "take_profit_price"]):
+            if not pm.keys() >= POSITION_FIELDS:
                 return False
                 
             # 验证action值的有效性
-            valid_actions = ["hold", "open_long", "open_short", "close_long", "close_short"]
-            if td["action"] not in valid_actions:
+            if td["action"] not in VALID_ACTIONS:
                 return False
                 
             # 验证confidence_level值的有效性
-            valid_confidences = ["high", "medium", "low"]
-            if td["confidence_level"] not in valid_confidences:
+            if td["confidence_level"] not in VALID_CONFIDENCES:
                 return False
                 
             return True
             
-        except:
+        except (KeyError, TypeError, AttributeError):
             return False
 
 # ==================== 模块4: 交易执行模块 ====================
@@ -543,6 +918,14 @@ class OKXTradingExecutor:
     
     def __init__(self, data_collector: OKXDataCollector):
         self.dc = data_collector
+        # 交易动作分发表，处理函数统一接收修正后的仓位
+        self._dispatch = {
+            "hold": self._handle_hold,
+            "open_long": lambda size: self._handle_open("open_long", size),
+            "open_short": lambda size: self._handle_open("open_short", size),
+            "close_long": self._handle_close,
+            "close_short": self._handle_close
+        }
     
     def execute_trade(self, decision: Dict, current_price: float) -> bool:
         """执行交易决策"""
@@ -557,34 +940,38 @@ class OKXTradingExecutor:
             
             write_echo(f"执行: {action}, 仓位: {position_size:.4f} ETH")
             
-            if action == "hold":
-                write_echo("保持持仓")
-                return True
-                
-            elif action in ["open_long", "open_short"]:
-                if position_size > 0:
-                    success = self._place_order(action, position_size)
-                    if success:
-                        write_echo("✅ 开仓成功")
-                    return success
-                else:
-                    write_echo("仓位为0，跳过开仓")
-                    return True
-                
-            elif action in ["close_long", "close_short"]:
-                success = self._close_position()
-                if success:
-                    write_echo("✅ 平仓成功")
-                return success
-                
-            else:
+            handler = self._dispatch.get(action)
+            if handler is None:
                 write_error(f"未知交易动作: {action}")
                 return False
+            return handler(position_size)
                 
         except Exception as e:
             write_error(f"执行交易失败: {e}")
             return False
     
+    def _handle_hold(self, size: float) -> bool:
+        """持有不动"""
+        write_echo("保持持仓")
+        return True
+    
+    def _handle_open(self, action: str, size: float) -> bool:
+        """开仓，仓位为0时跳过"""
+        if size <= 0:
+            write_echo("仓位为0，跳过开仓")
+            return True
+        success = self._place_order(action, size)
+        if success:
+            write_echo("✅ 开仓成功")
+        return success
+    
+    def _handle_close(self, size: float) -> bool:
+        """平掉当前持仓"""
+        success = self._close_position()
+        if success:
+            write_echo("✅ 平仓成功")
+        return success
+    
     def _place_order(self, action: str, size: float) -> bool:
         """下单"""
         try:
@@ -639,6 +1026,13 @@ class ETHTradingBot:
         self.ai_processor = DeepSeekAI(DEEPSEEK_API_KEY)
         self.trading_executor = OKXTradingExecutor(self.data_collector)
         
+        # 行情/持仓/账户改为推送订阅，未安装依赖或推送过期时自动回退REST
+        ws_client = OKXWebSocketClient(self.data_collector)
+        if ws_client.start():
+            self.data_collector.ws_client = ws_client
+        # 数据收集线程池，K线/余额/持仓三个请求互不依赖，可并行发出
+        self.io_pool = ThreadPoolExecutor(max_workers=3)
+        
         write_echo("交易机器人初始化完成")
     
     def run_single_cycle(self):
@@ -646,9 +1040,16 @@ class ETHTradingBot:
         try:
             write_echo("开始交易周期")
             
-            # 1. 收集市场数据
-            klines = self.data_collector.get_kline_data()
-            current_price = klines[0]['close'] if klines else 0
+            # 1-3. 并行收集市场数据、账户状态和持仓信息
+            kline_future = self.io_pool.submit(self.data_collector.get_kline_data)
+            account_future = self.io_pool.submit(self.data_collector.get_account_balance)
+            position_future = self.io_pool.submit(self.data_collector.get_position_info)
+            
+            klines = kline_future.result()
+            account_status = account_future.result()
+            position_info = position_future.result()
+            
+            current_price = self.data_collector.get_realtime_price() or (float(klines['close'][0]) if len(klines['close']) else 0)
             
             market_data = {
                 "current_price": current_price,
@@ -657,12 +1058,6 @@ class ETHTradingBot:
             
             write_echo(f"当前价格: {current_price:.2f} USDT")
             
-            # 2. 获取账户状态
-            account_status = self.data_collector.get_account_balance()
-            
-            # 3. 获取持仓信息
-            position_info = self.data_collector.get_position_info()
-            
             # 4. AI决策
             ai_decision = self.ai_processor.get_trading_decision(
                 market_data, account_status, position_info
@@ -685,11 +1080,21 @@ class ETHTradingBot:
         """持续运行"""
         write_echo("开始持续运行")
         
+        # 按单调时钟的截止时间调度，周期耗时不会累积成节奏漂移
+        deadline = time.monotonic()
+        
         while True:
             try:
                 self.run_single_cycle()
-                write_echo(f"等待 {AI_FREQUENCY} 秒")
-                time.sleep(AI_FREQUENCY)
+                deadline += AI_FREQUENCY
+                wait_seconds = deadline - time.monotonic()
+                if wait_seconds <= 0:
+                    # 周期超时则从当前时间重新计时，避免连续补跑
+                    write_echo(f"交易周期超出 {AI_FREQUENCY} 秒，立即开始下一周期")
+                    deadline = time.monotonic()
+                    continue
+                write_echo(f"等待 {wait_seconds:.1f} 秒")
+                time.sleep(wait_seconds)
                 
             except KeyboardInterrupt:
                 write_echo("程序被用户中断")
@@ -698,6 +1103,7 @@ class ETHTradingBot:
                 write_error(f"主循环异常: {e}")
                 write_echo("30秒后重试...")
                 time.sleep(30)
+                deadline = time.monotonic()
 
 if __name__ == "__main__":
     bot = ETHTradingBot()
@@ -16,12 +16,26 @@ import hashlib
 import base64
 import json
 import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import re
-from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional
+import random
+import threading
+import queue
+import atexit
+from datetime import datetime, timedelta
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 import urllib.parse
 
+try:
+    import orjson  # 更快的JSON编解码，可选依赖
+except ImportError:
+    orjson = None
+
 # ==================== 基础配置 ====================
 OKX_API_KEY = ""
 OKX_SECRET = ""
@@ -36,6 +50,27 @@ LEVERAGE = 100
 MIN_ORDER_SIZE = 0.001
 MAX_ORDER_SIZE = 0.010
 AI_FREQUENCY = 300
+AI_MAX_REUSE_CYCLES = 10  # 行情无变化时最多连续复用持有决策的周期数
+AI_REUSE_PRICE_EPSILON = 0.001  # 价格变动小于0.1%且持仓不变时视为行情无变化
+
+# HTTP连接池配置
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 8
+# 请求重试的退避: 初始等待与最长等待(秒)，每次翻倍并叠加随机抖动
+HTTP_RETRY_BASE_WAIT = 0.1
+HTTP_RETRY_MAX_WAIT = 1.0
+OKX_TIMEOUT = (3.05, 10)  # (连接超时, 读取超时)，连接失败尽快重试
+
+# 查询结果短时缓存(秒)，K线缓存时间不超过一根K线周期
+ACCOUNT_CACHE_TTL = 2.0
+KLINE_CACHE_MAX_TTL = 30.0
+# 下单后轮询持仓确认成交的超时与间隔(秒)
+ORDER_SETTLE_TIMEOUT = 3.0
+ORDER_POLL_INTERVAL = 0.2
+MOCK_KLINE_TTL = 60.0  # 接口失败时模拟K线的复用时间(秒)
+# 退出时保存K线缓存，重启后增量更新；放在脚本所在目录，不受启动时工作目录影响
+KLINE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kline_cache.json")
+BAR_SECONDS = {"1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800, "1H": 3600, "4H": 14400, "1D": 86400}
 
 logging.basicConfig(
     level=logging.INFO,
@@ -46,45 +81,179 @@ logger = logging.getLogger()
 ERROR_FILE = "baocuo.txt"
 ECHO_FILE = "huixian.txt"
 
-def write_error(message: str):
-    """写入错误信息到报错文件"""
-    try:
-        with open(ERROR_FILE, "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now()} - ERROR: {message}\n")
-    except Exception as e:
-        print(f"无法写入错误文件: {e}")
-
-def write_echo(message: str):
-    """写入回显信息到回显文件"""
-    try:
-        with open(ECHO_FILE, "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now()} - ECHO: {message}\n")
-    except Exception as e:
-        print(f"无法写入回显文件: {e}")
+# 日志由后台线程格式化并写入常驻的缓冲文件句柄，调用方只负责入队
+_log_queue = queue.SimpleQueue()
+_log_files = {}
+_LOG_FLUSH = object()  # 刷盘标记
+
+def _append_log(filename: str, line: bytes, flush: bool = False):
+    """追加一行日志到缓冲文件句柄，二进制模式写入省去文本层编码，仅由日志线程调用"""
+    f = _log_files.get(filename)
+    if f is None:
+        f = open(filename, "ab", buffering=8192)
+        _log_files[filename] = f
+    f.write(line)
+    if flush:
+        f.flush()
+
+def _log_writer_loop():
+    """后台日志线程：延迟格式化日志参数并写入文件"""
+    while True:
+        item = _log_queue.get()
+        if item is None:
+            break
+        if item is _LOG_FLUSH:
+            for f in _log_files.values():
+                f.flush()
+            continue
+        
+        filename, tag, created, message, args, flush = item
+        try:
+            if args:
+                message = message % args
+            line = b"%b - %b: %b\n" % (str(datetime.fromtimestamp(created)).encode(), tag, message.encode('utf-8'))
+            _append_log(filename, line, flush)
+        except Exception as e:
+            print(f"无法写入日志文件 {filename}: {e}")
+
+_log_thread = threading.Thread(target=_log_writer_loop, name="log-writer", daemon=True)
+_log_thread.start()
+
+def flush_logs():
+    """请求日志线程将缓冲中的日志写入磁盘"""
+    _log_queue.put(_LOG_FLUSH)
+
+def _close_logs():
+    """退出时写完队列中剩余日志并关闭文件"""
+    _log_queue.put(None)
+    _log_thread.join(timeout=5)
+    for f in _log_files.values():
+        f.close()
+    _log_files.clear()
+
+atexit.register(_close_logs)
+
+# 行情、余额、持仓三项查询互不依赖，并发发起
+_IO_POOL = ThreadPoolExecutor(max_workers=3)
+
+def write_error(message: str, *args):
+    """写入错误信息到报错文件，错误较少且重要，立即刷盘；args非空时按%格式化延迟到日志线程"""
+    _log_queue.put((ERROR_FILE, b"ERROR", time.time(), message, args, True))
+
+def write_echo(message: str, *args):
+    """写入回显信息到回显文件；args非空时按%格式化延迟到日志线程"""
+    _log_queue.put((ECHO_FILE, b"ECHO", time.time(), message, args, False))
+
+class JitteredRetry(Retry):
+    """指数退避叠加随机抖动并限制最长等待，避免多个请求同时重试"""
+    
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time() + random.uniform(0, HTTP_RETRY_BASE_WAIT)
+        return min(HTTP_RETRY_MAX_WAIT, backoff)
+
+# 连接错误对所有请求重试；读超时、限流和5xx只重试GET，避免下单请求被重复提交
+HTTP_RETRY = JitteredRetry(
+    total=3,
+    backoff_factor=HTTP_RETRY_BASE_WAIT,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({'GET'}),
+    raise_on_status=False
+)
+
+def create_http_session() -> requests.Session:
+    """创建带连接池的HTTP会话，复用TCP+TLS连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=HTTP_RETRY
+    )
+    session.mount("https://", adapter)
+    session.headers.update({'Content-Type': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+def json_dumps(obj, indent: bool = False) -> str:
+    """JSON序列化，优先使用orjson，未安装时回退标准库"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(',', ':'))
+
+def json_loads(data):
+    """JSON反序列化，支持str和bytes，优先使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+@lru_cache(maxsize=256)
+def _format_candle_time(ts_ms: str) -> str:
+    """K线时间戳(毫秒)转本地时间字符串，已收盘K线的时间戳会重复出现，结果缓存复用"""
+    return datetime.fromtimestamp(int(ts_ms)/1000).strftime('%Y-%m-%d %H:%M:%S')
+
+def _parse_candles(data: List[List[str]]) -> List[Dict]:
+    """解析OKX原始K线数组"""
+    # 一次性把OHLCV列转换为float64数组，再转回Python float供提示词序列化
+    values = np.asarray([candle[1:6] for candle in data], dtype=np.float64).reshape(-1, 5).tolist()
+    return [
+        {
+            "timestamp": _format_candle_time(candle[0]),
+            "open": o,
+            "high": h,
+            "low": l,
+            "close": c,
+            "volume": v
+        }
+        for candle, (o, h, l, c, v) in zip(data, values)
+    ]
 
 # ==================== 模块1: 信息收集模块 ====================
 class OKXDataCollector:
     """OKX数据收集器"""
     
+    # 模拟K线模板: (距当前分钟数, 开, 高, 低, 收, 量)，基准价3500
+    _MOCK_KLINE_TEMPLATE = (
+        (15, 3500.0, 3520.0, 3490.0, 3505.0, 1500.0),
+        (10, 3505.0, 3525.0, 3495.0, 3510.0, 1200.0),
+        (5, 3510.0, 3530.0, 3500.0, 3508.0, 1800.0),
+        (0, 3508.0, 3535.0, 3505.0, 3512.0, 2000.0)
+    )
+    
     def __init__(self, api_key: str, secret: str, password: str):
         self.api_key = api_key
         self.secret = secret
         self.password = password
+        self._secret_bytes = secret.encode('utf-8')  # 签名密钥只编码一次
+        # 预先完成HMAC密钥扩展，每次签名只复制模板
+        self._hmac_template = hmac.new(self._secret_bytes, digestmod=hashlib.sha256)
+        self._ts_cache = (-1, "")  # 时间戳秒级前缀缓存 (秒, 前缀)
+        # GET查询结果缓存: (endpoint, 参数) -> (获取时间, 数据)
+        self._cache: Dict[tuple, tuple] = {}
+        self._cache_lock = threading.Lock()
+        self._mock_klines = None
+        self._mock_klines_time = 0.0
+        # 增量K线缓存: (合约, 周期) -> (更新时间, 原始K线列表，最新在前)
+        self._kline_rows: Dict[tuple, tuple] = {}
+        self._load_kline_cache()
+        atexit.register(self._save_kline_cache)
         self.base_url = "https://www.okx.com"
+        self.session = create_http_session()
+        # 固定的认证头只设置一次，每次请求仅附带签名和时间戳
+        self.session.headers.update({
+            'OK-ACCESS-KEY': self.api_key,
+            'OK-ACCESS-PASSPHRASE': self.password
+        })
+        atexit.register(self.session.close)
         
-    def _generate_signature(self, timestamp: str, method: str, request_path: str, body: str = "") -> str:
-        """生成OKX API签名"""
+    def _generate_signature(self, timestamp: str, method: str, request_path: str, body: bytes = b"") -> str:
+        """生成OKX API签名，method需为大写，body为已编码的请求体"""
         try:
-            if body is None:
-                body = ""
-                
-            message = timestamp + method.upper() + request_path + body
+            message = f"{timestamp}{method}{request_path}".encode('utf-8')
+            if body:
+                message += body
             
-            mac = hmac.new(
-                bytes(self.secret, encoding='utf-8'),
-                bytes(message, encoding='utf-8'),
-                digestmod='sha256'
-            )
+            mac = self._hmac_template.copy()
+            mac.update(message)
             signature = base64.b64encode(mac.digest()).decode()
             return signature
             
@@ -93,48 +262,56 @@ class OKXDataCollector:
             raise
     
     def _get_timestamp(self) -> str:
-        """获取OKX格式的时间戳"""
-        now = datetime.now(timezone.utc)
-        timestamp = now.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-        return timestamp
+        """获取OKX格式的时间戳，秒级前缀在同一秒内复用"""
+        t = time.time()
+        s = int(t)
+        cached_second, prefix = self._ts_cache
+        if s != cached_second:
+            tup = time.gmtime(s)
+            prefix = f"{tup.tm_year:04d}-{tup.tm_mon:02d}-{tup.tm_mday:02d}T{tup.tm_hour:02d}:{tup.tm_min:02d}:{tup.tm_sec:02d}"
+            self._ts_cache = (s, prefix)
+        return f"{prefix}.{int((t - s) * 1000):03d}Z"
     
     def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
-        """发送API请求"""
+        """发送API请求，限流与5xx的GET重试由连接池的HTTP_RETRY处理"""
         try:
-            # 构建请求路径和URL
+            method = method.upper()
             request_path = endpoint
-            url = self.base_url + endpoint
-            
             timestamp = self._get_timestamp()
-            body = ""
+            body = b""
             
             # 处理GET请求参数
-            if method.upper() == 'GET' and params:
-                query_string = '&'.join([f"{k}={v}" for k, v in params.items()])
-                request_path = endpoint + '?' + query_string
-                url = self.base_url + request_path
-            elif method.upper() == 'POST' and params:
-                body = json.dumps(params, separators=(',', ':'))
+            if method == 'GET' and params:
+                query_string = urllib.parse.urlencode(params)
+                request_path = f"{endpoint}?{query_string}"
+            elif method == 'POST':
+                # 下单/平仓会改变账户状态，清空查询缓存
+                with self._cache_lock:
+                    self._cache.clear()
+                if params:
+                    # 请求体只编码一次，签名与发送使用同一份字节
+                    body = json_dumps(params).encode('utf-8')
             
-            signature = self._generate_signature(timestamp, method.upper(), request_path, body)
+            url = self.base_url + request_path
+            
+            signature = self._generate_signature(timestamp, method, request_path, body)
             
             headers = {
-                'OK-ACCESS-KEY': self.api_key,
                 'OK-ACCESS-SIGN': signature,
-                'OK-ACCESS-TIMESTAMP': timestamp,
-                'OK-ACCESS-PASSPHRASE': self.password,
-                'Content-Type': 'application/json'
+                'OK-ACCESS-TIMESTAMP': timestamp
             }
             
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers, timeout=10)
+            if method == 'GET':
+                response = self.session.get(url, headers=headers, timeout=OKX_TIMEOUT)
             else:
-                response = requests.post(url, headers=headers, data=body, timeout=10)
+                response = self.session.post(url, headers=headers, data=body, timeout=OKX_TIMEOUT)
             
-            write_echo(f"API请求: {method} {endpoint} - 状态码: {response.status_code}")
+            status_code = response.status_code
+            write_echo("API请求: %s %s - 状态码: %s", method, endpoint, status_code)
             
-            response.raise_for_status()
-            result = response.json()
+            if status_code >= 400:
+                raise requests.HTTPError(f"{status_code} 错误: {response.text[:200]}", response=response)
+            result = json_loads(response.content)
             
             if result['code'] != '0':
                 error_msg = f"API错误: {result['msg']} (代码: {result['code']})"
@@ -151,8 +328,22 @@ class OKXDataCollector:
             write_error(f"API请求失败: {e}")
             raise
     
+    def _cached_get(self, endpoint: str, params: Optional[Dict], ttl: float) -> Any:
+        """带TTL缓存的GET请求，缓存未过期时直接返回上次结果"""
+        key = (endpoint, tuple(sorted(params.items())) if params else ())
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry is not None and now - entry[0] < ttl:
+            return entry[1]
+        
+        data = self._make_request('GET', endpoint, params)
+        with self._cache_lock:
+            self._cache[key] = (now, data)
+        return data
+    
     def get_kline_data(self, symbol: str = SYMBOL, bar: str = "5m", limit: int = 4) -> List[Dict]:
-        """获取K线数据"""
+        """完整获取K线数据，结果写入K线缓存供后续增量更新"""
         try:
             endpoint = "/api/v5/market/candles"
             params = {
@@ -162,66 +353,102 @@ class OKXDataCollector:
             }
             
             data = self._make_request('GET', endpoint, params)
-            klines = []
-            
-            for candle in data:
-                klines.append({
-                    "timestamp": datetime.fromtimestamp(int(candle[0])/1000).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": float(candle[1]),
-                    "high": float(candle[2]),
-                    "low": float(candle[3]),
-                    "close": float(candle[4]),
-                    "volume": float(candle[5])
-                })
+            self._kline_rows[(symbol, bar)] = (time.monotonic(), data)
+            klines = _parse_candles(data)
             
             write_echo(f"获取K线数据成功: {len(klines)}根")
             return klines
             
         except Exception as e:
             write_error(f"获取K线数据失败: {e}")
-            # 返回模拟数据避免程序中断
-            current_time = datetime.now()
-            base_price = 3500.0
-            return [
-                {
-                    "timestamp": (current_time - timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price,
-                    "high": base_price + 20,
-                    "low": base_price - 10,
-                    "close": base_price + 5,
-                    "volume": 1500.0
-                },
-                {
-                    "timestamp": (current_time - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 5,
-                    "high": base_price + 25,
-                    "low": base_price - 5,
-                    "close": base_price + 10,
-                    "volume": 1200.0
-                },
-                {
-                    "timestamp": (current_time - timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 10,
-                    "high": base_price + 30,
-                    "low": base_price,
-                    "close": base_price + 8,
-                    "volume": 1800.0
-                },
-                {
-                    "timestamp": current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 8,
-                    "high": base_price + 35,
-                    "low": base_price + 5,
-                    "close": base_price + 12,
-                    "volume": 2000.0
-                }
-            ]
+            # 返回模拟数据避免程序中断，连续失败时短时间内复用同一份数据
+            now = time.monotonic()
+            if self._mock_klines is None or now - self._mock_klines_time >= MOCK_KLINE_TTL:
+                current_time = datetime.now()
+                self._mock_klines = [
+                    {
+                        "timestamp": (current_time - timedelta(minutes=offset)).strftime('%Y-%m-%d %H:%M:%S'),
+                        "open": o,
+                        "high": h,
+                        "low": l,
+                        "close": c,
+                        "volume": v
+                    }
+                    for offset, o, h, l, c, v in self._MOCK_KLINE_TEMPLATE
+                ]
+                self._mock_klines_time = now
+            return self._mock_klines
+    
+    def is_fallback_klines(self, klines: List[Dict]) -> bool:
+        """是否为接口失败时返回的模拟K线"""
+        return klines is self._mock_klines
+    
+    def get_kline_data_incremental(self, symbol: str = SYMBOL, bar: str = "5m", limit: int = 4) -> List[Dict]:
+        """增量获取K线数据：只请求缓存中最新已收盘K线之后的K线并与缓存合并，失败时回退完整获取"""
+        try:
+            klines = _parse_candles(self._update_kline_rows(symbol, bar, limit))
+            write_echo(f"增量获取K线数据成功: {len(klines)}根")
+            return klines
+        except Exception as e:
+            write_error(f"增量获取K线数据失败，回退完整获取: {e}")
+            return self.get_kline_data(symbol, bar, limit)
+    
+    def _update_kline_rows(self, symbol: str, bar: str, limit: int) -> List[List[str]]:
+        """更新并返回指定合约周期的原始K线缓存"""
+        key = (symbol, bar)
+        now = time.monotonic()
+        fetched_at, rows = self._kline_rows.get(key, (None, []))
+        ttl = min(BAR_SECONDS.get(bar, 60), KLINE_CACHE_MAX_TTL)
+        if fetched_at is not None and now - fetched_at < ttl and len(rows) >= limit:
+            return rows[:limit]
+        
+        endpoint = "/api/v5/market/candles"
+        params = {'instId': symbol, 'bar': bar, 'limit': limit}
+        if len(rows) >= limit >= 2:
+            # rows[0]为未收盘K线，以最新已收盘K线为锚点，只取其后的K线(含更新后的未收盘K线)
+            anchor = rows[1][0]
+            newer = self._make_request('GET', endpoint, {**params, 'before': anchor})
+            if len(newer) < limit:
+                rows = newer + [row for row in rows if int(row[0]) <= int(anchor)]
+            else:
+                # 缓存落后太多，直接取完整窗口
+                rows = self._make_request('GET', endpoint, params)
+        else:
+            rows = self._make_request('GET', endpoint, params)
+        
+        rows = rows[:limit]
+        self._kline_rows[key] = (now, rows)
+        return rows
+    
+    def _load_kline_cache(self):
+        """从文件加载上次退出时保存的K线缓存，加载后首次使用仍会向交易所增量更新"""
+        try:
+            if not os.path.exists(KLINE_CACHE_FILE):
+                return
+            with open(KLINE_CACHE_FILE, "rb") as f:
+                saved = json_loads(f.read())
+            for key, rows in saved.items():
+                symbol, bar = key.split("|", 1)
+                self._kline_rows[(symbol, bar)] = (None, rows)
+        except Exception as e:
+            write_error(f"加载K线缓存失败: {e}")
+    
+    def _save_kline_cache(self):
+        """退出时保存K线缓存"""
+        try:
+            if not self._kline_rows:
+                return
+            saved = {f"{symbol}|{bar}": rows for (symbol, bar), (_, rows) in self._kline_rows.items()}
+            with open(KLINE_CACHE_FILE, "w", encoding="utf-8") as f:
+                f.write(json_dumps(saved))
+        except Exception as e:
+            write_error(f"保存K线缓存失败: {e}")
     
     def get_account_balance(self) -> Dict:
         """获取账户余额信息"""
         try:
             endpoint = "/api/v5/account/balance"
-            data = self._make_request('GET', endpoint)
+            data = self._cached_get(endpoint, None, ACCOUNT_CACHE_TTL)
             
             if not data:
                 raise Exception("账户数据为空")
@@ -243,12 +470,12 @@ class OKXDataCollector:
                 "total_equity": 4.52
             }
     
-    def get_position_info(self, symbol: str = SYMBOL) -> Dict:
-        """获取持仓信息"""
+    def get_position_info(self, symbol: str = SYMBOL, cache_ttl: float = ACCOUNT_CACHE_TTL) -> Dict:
+        """获取持仓信息，cache_ttl为0时总是查询最新持仓"""
         try:
             endpoint = "/api/v5/account/positions"
             params = {'instId': symbol}
-            data = self._make_request('GET', endpoint, params)
+            data = self._cached_get(endpoint, params, cache_ttl)
             
             position_data = {
                 "position_side": "flat",
@@ -280,37 +507,44 @@ class OKXDataCollector:
                 "entry_price": 0.0,
                 "leverage": LEVERAGE
             }
+    
+    def fetch_cycle_data(self) -> tuple:
+        """并发获取一个周期所需的K线、账户余额和持仓信息，耗时取决于最慢的一项"""
+        f_klines = _IO_POOL.submit(self.get_kline_data_incremental)
+        f_balance = _IO_POOL.submit(self.get_account_balance)
+        f_position = _IO_POOL.submit(self.get_position_info)
+        return f_klines.result(), f_balance.result(), f_position.result()
 
 # ==================== 模块2: AI输入模块 ====================
 class DeepSeekAI:
     """DeepSeek AI交易决策"""
     
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.deepseek.com/v1/chat/completions"
+    # 请求或解析失败时返回的保守持有决策的理由，该决策不是AI的真实判断，不能缓存复用
+    PARSE_FAILED_REASON = "AI响应解析失败，采用保守策略"
+    REQUEST_FAILED_PREFIX = "AI处理失败: "
     
-    def get_trading_decision(self, market_data: Dict, account_status: Dict, position_info: Dict) -> Dict:
-        """获取AI交易决策"""
-        try:
-            # 在AI请求前记录账户状态和持仓信息
-            write_echo("=== AI请求账户状态 ===")
-            write_echo(f"可用余额: {account_status['available_OKX']:.6f} USDT")
-            write_echo(f"账户总权益: {account_status['total_equity']:.6f} USDT")
-            write_echo(f"持仓方向: {position_info['position_side']}")
-            write_echo(f"持仓数量: {position_info['position_size']:.6f} ETH")
-            write_echo(f"开仓均价: {position_info['entry_price']:.2f} USDT")
-            write_echo(f"杠杆倍数: {position_info['leverage']}倍")
-            
-            # 构建AI提示词 - 完全保持原版模板
-            prompt = self._build_prompt(market_data, account_status, position_info)
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {self.api_key}'
-            }
-            
-            # 完整的系统提示词 - 完全保持原版
-            system_prompt = """角色定位：你是顶级量化竞技AI交易员，专注于OKX交易所的ETH永续合约交易，并且与其他AI交易员互相竞争
+    # 响应解析用的正则，类加载时编译一次
+    _JSON_BLOCK_RE = re.compile(r'\{\s*"trading_decision"\s*:\s*\{[^{}]*\},\s*"position_management"\s*:\s*\{[^{}]*\}\s*\}', re.DOTALL)
+    _WS_RE = re.compile(r'\s+')
+    _ACTION_RES = (
+        re.compile(r'"action"\s*:\s*"(\w+)"', re.IGNORECASE),
+        re.compile(r'action["\']?\s*:\s*["\']?(\w+)', re.IGNORECASE),
+        re.compile(r'操作["\']?\s*:\s*["\']?(\w+)', re.IGNORECASE)
+    )
+    _REASON_RES = (
+        re.compile(r'"reason"\s*:\s*"([^"]*)"', re.IGNORECASE),
+        re.compile(r'reason["\']?\s*:\s*["\']?([^"\']+)', re.IGNORECASE),
+        re.compile(r'理由["\']?\s*:\s*["\']?([^"\']+)', re.IGNORECASE)
+    )
+    
+    # 决策格式校验用的字段与取值集合
+    _TD_KEYS = frozenset(("action", "confidence_level", "reason"))
+    _PM_KEYS = frozenset(("position_size", "stop_loss_price", "take_profit_price"))
+    _VALID_ACTIONS = frozenset(("hold", "open_long", "open_short", "close_long", "close_short"))
+    _VALID_CONF = frozenset(("high", "medium", "low"))
+    
+    # 完整的系统提示词 - 完全保持原版
+    SYSTEM_PROMPT = """角色定位：你是顶级量化竞技AI交易员，专注于OKX交易所的ETH永续合约交易，并且与其他AI交易员互相竞争
 核心目标：在小资金实盘环境下，通过精准策略在激烈竞争中保持优势并实现稳定盈利
 环境认知：
 1. 充满顶级AI对手的高效衍生品市场
@@ -359,49 +593,64 @@ class DeepSeekAI:
     "take_profit_price": 3580.0              // 建议止盈价格(USDT)
   }
 }"""
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.base_url = "https://api.deepseek.com/v1/chat/completions"
+        self.session = create_http_session()
+        self.session.headers.update({'Authorization': f'Bearer {self.api_key}'})
+        atexit.register(self.session.close)
+        # 上次构建的提示词及其输入快照
+        self._prompt_key = None
+        self._prompt = ""
+        self._system_message = {"role": "system", "content": self.SYSTEM_PROMPT}
+        # 请求体中固定不变的部分预先序列化，每次只序列化用户提示词后拼接
+        self._body_template = self._make_body_template()
+        self._stream_body_template = self._make_body_template(stream=True, stream_options={"include_usage": True})
+    
+    def get_trading_decision(self, market_data: Dict, account_status: Dict, position_info: Dict) -> Dict:
+        """获取AI交易决策"""
+        try:
+            # 在AI请求前记录账户状态和持仓信息
+            write_echo("\n".join([
+                "=== AI请求账户状态 ===",
+                f"可用余额: {account_status['available_OKX']:.6f} USDT",
+                f"账户总权益: {account_status['total_equity']:.6f} USDT",
+                f"持仓方向: {position_info['position_side']}",
+                f"持仓数量: {position_info['position_size']:.6f} ETH",
+                f"开仓均价: {position_info['entry_price']:.2f} USDT",
+                f"杠杆倍数: {position_info['leverage']}倍"
+            ]))
             
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
-            
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            
-            ai_response = result['choices'][0]['message']['content']
-            write_echo("AI原始响应接收成功")
+            # 构建AI提示词 - 完全保持原版模板
+            prompt = self._build_prompt(market_data, account_status, position_info)
             
+            try:
+                ai_response = self._stream_completion(prompt)
+            except Exception as e:
+                write_error(f"流式请求失败，回退普通请求: {e}")
+                ai_response = self._fetch_completion(prompt)
             # 记录AI原始响应到回显文件以便调试
-            write_echo(f"AI原始响应: {ai_response}")
+            write_echo(f"AI原始响应接收成功\nAI原始响应: {ai_response}")
             
             decision = self._parse_ai_response(ai_response)
             
             # 记录AI决策详细信息
-            write_echo("=== AI交易决策 ===")
-            write_echo(f"操作类型: {decision['trading_decision']['action']}")
-            write_echo(f"信心等级: {decision['trading_decision']['confidence_level']}")
-            write_echo(f"决策理由: {decision['trading_decision']['reason']}")
-            write_echo(f"建议仓位: {decision['position_management']['position_size']:.6f} ETH")
-            
             action = decision['trading_decision']['action']
             if action in ['open_long', 'open_short']:
-                write_echo("📈 开仓信号")
+                signal = "📈 开仓信号"
             elif action in ['close_long', 'close_short']:
-                write_echo("📉 平仓信号")
+                signal = "📉 平仓信号"
             else:
-                write_echo("⏸️ 保持持仓")
+                signal = "⏸️ 保持持仓"
+            write_echo("\n".join([
+                "=== AI交易决策 ===",
+                f"操作类型: {action}",
+                f"信心等级: {decision['trading_decision']['confidence_level']}",
+                f"决策理由: {decision['trading_decision']['reason']}",
+                f"建议仓位: {decision['position_management']['position_size']:.6f} ETH",
+                signal
+            ]))
                 
             return decision
             
@@ -412,7 +661,7 @@ class DeepSeekAI:
                 "trading_decision": {
                     "action": "hold",
                     "confidence_level": "low",
-                    "reason": f"AI处理失败: {str(e)}"
+                    "reason": f"{self.REQUEST_FAILED_PREFIX}{e}"
                 },
                 "position_management": {
                     "position_size": 0,
@@ -421,8 +670,123 @@ class DeepSeekAI:
                 }
             }
     
+    def is_fallback_decision(self, decision: Dict) -> bool:
+        """是否为请求或解析失败时返回的保守持有决策"""
+        reason = decision["trading_decision"]["reason"]
+        return reason == self.PARSE_FAILED_REASON or reason.startswith(self.REQUEST_FAILED_PREFIX)
+    
+    def _make_body_template(self, **extra) -> tuple:
+        """预先序列化请求体中用户提示词之前和之后的固定部分，返回(前缀, 后缀)字节"""
+        static = {"model": "deepseek-chat", "temperature": 0.7, "max_tokens": 2000, **extra}
+        prefix = json_dumps(static)[:-1] + ',"messages":[' + json_dumps(self._system_message) + ',{"role":"user","content":'
+        return prefix.encode('utf-8'), b'}]}'
+    
+    @staticmethod
+    def _build_body(template: tuple, prompt: str) -> bytes:
+        """把用户提示词拼接进预先序列化的请求体模板"""
+        prefix, suffix = template
+        return prefix + json_dumps(prompt).encode('utf-8') + suffix
+    
+    def _fetch_completion(self, prompt: str) -> str:
+        """普通请求，等待完整响应后返回内容"""
+        body = self._build_body(self._body_template, prompt)
+        response = self.session.post(self.base_url, data=body, timeout=30)
+        response.raise_for_status()
+        result = json_loads(response.content)
+        self._log_cache_usage(result.get('usage'))
+        return result['choices'][0]['message']['content']
+    
+    def _stream_completion(self, prompt: str) -> str:
+        """流式请求(SSE)，边接收边检测，收到完整有效的决策JSON后立即返回，剩余内容在后台读完"""
+        parts = []
+        body = self._build_body(self._stream_body_template, prompt)
+        response = self.session.post(self.base_url, data=body, timeout=30, stream=True)
+        try:
+            response.raise_for_status()
+            lines = response.iter_lines()
+            for line in lines:
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json_loads(data)
+                if not chunk.get('choices'):
+                    # 最后一个数据块只携带usage
+                    self._log_cache_usage(chunk.get('usage'))
+                    continue
+                content = chunk['choices'][0]['delta'].get('content')
+                if not content:
+                    continue
+                parts.append(content)
+                # 只有出现右括号时才可能形成完整的决策对象
+                if '}' in content and self._has_complete_decision(''.join(parts)):
+                    # usage在最后一个内容块之后才到达，交给后台线程读取，不延迟返回
+                    threading.Thread(target=self._drain_stream_usage, args=(response, lines),
+                                     name="ai-usage", daemon=True).start()
+                    response = None
+                    break
+        finally:
+            if response is not None:
+                response.close()
+        
+        if not parts:
+            raise ValueError("流式响应内容为空")
+        return ''.join(parts)
+    
+    def _drain_stream_usage(self, response: requests.Response, lines):
+        """读完流式响应的剩余部分并记录usage，读完后连接可回到连接池复用"""
+        try:
+            for line in lines:
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                chunk = json_loads(data)
+                if not chunk.get('choices'):
+                    self._log_cache_usage(chunk.get('usage'))
+        except Exception as e:
+            write_error(f"读取AI流式响应usage失败: {e}")
+        finally:
+            response.close()
+    
+    @staticmethod
+    def _log_cache_usage(usage: Optional[Dict]):
+        """记录DeepSeek上下文缓存命中情况；系统提示词固定在消息首位，其token可被服务端缓存复用"""
+        if not usage or 'prompt_cache_hit_tokens' not in usage:
+            return
+        write_echo("AI上下文缓存: 命中 %s tokens, 未命中 %s tokens",
+                   usage['prompt_cache_hit_tokens'], usage.get('prompt_cache_miss_tokens', 0))
+    
+    def _has_complete_decision(self, text: str) -> bool:
+        """文本中是否已包含一个格式有效的决策JSON"""
+        for match in self._JSON_BLOCK_RE.findall(text):
+            try:
+                if self._validate_decision_format(json_loads(match)):
+                    return True
+            except ValueError:
+                continue
+        return False
+    
     def _build_prompt(self, market_data: Dict, account_status: Dict, position_info: Dict) -> str:
-        """构建AI输入提示词 - 完全保持原版模板"""
+        """构建AI输入提示词 - 完全保持原版模板，输入未变化时复用上次结果"""
+        klines = market_data["kline_5min"]
+        # 历史K线已收盘，只需比较最新一根K线即可判断行情是否变化
+        prompt_key = (
+            market_data["current_price"],
+            len(klines),
+            tuple(klines[0].values()) if klines else (),
+            account_status["available_OKX"],
+            account_status["total_equity"],
+            position_info["position_side"],
+            position_info["position_size"],
+            position_info["entry_price"],
+            position_info["leverage"]
+        )
+        if prompt_key == self._prompt_key:
+            return self._prompt
+        
         input_data = {
             "market_data": {
                 "current_price": market_data["current_price"],
@@ -440,32 +804,34 @@ class DeepSeekAI:
             }
         }
         
-        return json.dumps(input_data, indent=2, ensure_ascii=False)
+        self._prompt = json_dumps(input_data, indent=True)
+        self._prompt_key = prompt_key
+        return self._prompt
 
     def _parse_ai_response(self, response: str) -> Dict:
         """解析AI响应 - 增强解析能力，处理AI返回的非标准格式"""
         try:
             # 首先尝试直接解析整个响应
             try:
-                decision = json.loads(response)
+                decision = json_loads(response)
                 if self._validate_decision_format(decision):
                     return decision
-            except:
+            except (ValueError, TypeError):
+                # json与orjson的JSONDecodeError均为ValueError子类
                 pass
             
             # 如果直接解析失败，尝试提取符合我们模板的JSON部分
             # 使用更精确的正则表达式匹配我们的目标格式
-            pattern = r'\{\s*"trading_decision"\s*:\s*\{[^{}]*\},\s*"position_management"\s*:\s*\{[^{}]*\}\s*\}'
-            matches = re.findall(pattern, response, re.DOTALL)
+            matches = self._JSON_BLOCK_RE.findall(response)
             
             for match in matches:
                 try:
                     # 清理JSON字符串
                     json_str = match.replace('\n', ' ').replace('\t', ' ')
                     # 移除多余的空白字符
-                    json_str = re.sub(r'\s+', ' ', json_str).strip()
+                    json_str = self._WS_RE.sub(' ', json_str).strip()
                     
-                    decision = json.loads(json_str)
+                    decision = json_loads(json_str)
                     if self._validate_decision_format(decision):
                         write_echo("从响应中成功提取标准JSON决策")
                         return decision
@@ -484,7 +850,7 @@ class DeepSeekAI:
                 "trading_decision": {
                     "action": "hold",
                     "confidence_level": "low",
-                    "reason": "AI响应解析失败，采用保守策略"
+                    "reason": self.PARSE_FAILED_REASON
                 },
                 "position_management": {
                     "position_size": 0,
@@ -511,30 +877,17 @@ class DeepSeekAI:
             }
             
             # 尝试从响应中提取action
-            action_patterns = [
-                r'"action"\s*:\s*"(\w+)"',
-                r'action["\']?\s*:\s*["\']?(\w+)',
-                r'操作["\']?\s*:\s*["\']?(\w+)'
-            ]
-            
-            for pattern in action_patterns:
-                match = re.search(pattern, response, re.IGNORECASE)
+            for pattern in self._ACTION_RES:
+                match = pattern.search(response)
                 if match:
                     action = match.group(1).lower()
-                    valid_actions = ["hold", "open_long", "open_short", "close_long", "close_short"]
-                    if action in valid_actions:
+                    if action in self._VALID_ACTIONS:
                         decision["trading_decision"]["action"] = action
                         break
             
             # 尝试提取reason
-            reason_patterns = [
-                r'"reason"\s*:\s*"([^"]*)"',
-                r'reason["\']?\s*:\s*["\']?([^"\']+)',
-                r'理由["\']?\s*:\s*["\']?([^"\']+)'
-            ]
-            
-            for pattern in reason_patterns:
-                match = re.search(pattern, response, re.IGNORECASE)
+            for pattern in self._REASON_RES:
+                match = pattern.search(response)
                 if match:
                     reason = match.group(1).strip()
                     if reason:
@@ -562,25 +915,12 @@ class DeepSeekAI:
             td = decision["trading_decision"]
             pm = decision["position_management"]
             
-            if not all(field in td for field in ["action", "confidence_level", "reason"]):
-                return False
-                
-            if not all(field in pm for field in ["position_size", "stop_loss_price", "take_profit_price"]):
-                return False
-                
-            # 验证action值的有效性
-            valid_actions = ["hold", "open_long", "open_short", "close_long", "close_short"]
-            if td["action"] not in valid_actions:
-                return False
-                
-            # 验证confidence_level值的有效性
-            valid_confidences = ["high", "medium", "low"]
-            if td["confidence_level"] not in valid_confidences:
-                return False
-                
-            return True
+            # 必需字段齐全，且action与confidence_level取值有效
+            return (td.keys() >= self._TD_KEYS and pm.keys() >= self._PM_KEYS
+                    and td["action"] in self._VALID_ACTIONS
+                    and td["confidence_level"] in self._VALID_CONF)
             
-        except:
+        except (KeyError, TypeError, AttributeError):
             return False
 
 # ==================== 模块4: 交易执行模块 ====================
@@ -590,8 +930,8 @@ class OKXTradingExecutor:
     def __init__(self, data_collector: OKXDataCollector):
         self.dc = data_collector
     
-    def execute_trade(self, decision: Dict, current_price: float) -> bool:
-        """执行交易决策"""
+    def execute_trade(self, decision: Dict, current_price: float, position_info: Optional[Dict] = None) -> bool:
+        """执行交易决策，position_info为决策前获取的持仓信息"""
         try:
             action = decision["trading_decision"]["action"]
             position_size = decision["position_management"]["position_size"]
@@ -618,7 +958,7 @@ class OKXTradingExecutor:
                     return True
                 
             elif action in ["close_long", "close_short"]:
-                success = self._close_position()
+                success = self._close_position(position_info)
                 if success:
                     write_echo("✅ 平仓成功")
                 return success
@@ -631,27 +971,28 @@ class OKXTradingExecutor:
             write_error(f"执行交易失败: {e}")
             return False
     
+    def _send_order(self, side: str, size: float, set_leverage: bool):
+        """发送市价单，开仓与平仓共用"""
+        # 简化订单参数，避免复杂配置导致API错误
+        params = {
+            'instId': SYMBOL,
+            'tdMode': 'cross',  # 使用cross模式
+            'side': side,
+            'ordType': 'market',
+            'sz': str(size)
+        }
+        
+        # 只在开仓时设置杠杆，平仓时不设置
+        if set_leverage:
+            params['lever'] = str(LEVERAGE)
+        
+        return self.dc._make_request('POST', "/api/v5/trade/order", params)
+    
     def _place_order(self, action: str, size: float) -> bool:
         """下单"""
         try:
-            endpoint = "/api/v5/trade/order"
-            
             side = "buy" if action == "open_long" else "sell"
-            
-            # 简化订单参数，避免复杂配置导致API错误
-            params = {
-                'instId': SYMBOL,
-                'tdMode': 'cross',  # 使用cross模式
-                'side': side,
-                'ordType': 'market',
-                'sz': str(size)
-            }
-            
-            # 只在开仓时设置杠杆，平仓时不设置
-            if action in ["open_long", "open_short"]:
-                params['lever'] = str(LEVERAGE)
-            
-            result = self.dc._make_request('POST', endpoint, params)
+            self._send_order(side, size, action in ["open_long", "open_short"])
             write_echo(f"下单成功: {side} {size} ETH")
             return True
             
@@ -662,33 +1003,24 @@ class OKXTradingExecutor:
                 write_error("可能原因：资金不足，请检查账户余额")
             return False
     
-    def _close_position(self) -> bool:
-        """平仓"""
+    def _close_position(self, position_info: Optional[Dict] = None) -> bool:
+        """平仓，调用方已有本周期的持仓信息时直接传入，避免重复查询"""
         try:
-            position_info = self.dc.get_position_info()
+            if position_info is None:
+                position_info = self.dc.get_position_info()
             
             if position_info["position_size"] == 0:
                 write_echo("无持仓可平")
                 return True
             
             # 使用市价单平仓，而不是close-position接口
-            endpoint = "/api/v5/trade/order"
-            
             # 根据持仓方向决定平仓方向
             if position_info["position_side"] == "long":
                 side = "sell"
             else:
                 side = "buy"
             
-            params = {
-                'instId': SYMBOL,
-                'tdMode': 'cross',
-                'side': side,
-                'ordType': 'market',
-                'sz': str(position_info["position_size"])
-            }
-            
-            result = self.dc._make_request('POST', endpoint, params)
+            self._send_order(side, position_info["position_size"], False)
             write_echo("平仓成功")
             return True
             
@@ -696,6 +1028,25 @@ class OKXTradingExecutor:
             write_error(f"平仓失败: {e}")
             return False
     
+    def _wait_until(self, cond_fn, timeout: float = ORDER_SETTLE_TIMEOUT, poll: float = ORDER_POLL_INTERVAL) -> bool:
+        """轮询直到条件满足或超时，返回条件是否满足"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if cond_fn():
+                return True
+            time.sleep(poll)
+        return False
+    
+    def _position_snapshot(self) -> tuple:
+        """查询最新持仓 (方向, 数量)"""
+        position_info = self.dc.get_position_info(cache_ttl=0)
+        return position_info["position_side"], position_info["position_size"]
+    
+    def _wait_for_position_change(self, prior: tuple):
+        """等待交易所确认持仓变化，超时后继续后续步骤"""
+        if not self._wait_until(lambda: self._position_snapshot() != prior):
+            write_echo(f"等待持仓变化超时({ORDER_SETTLE_TIMEOUT}秒)，继续测试")
+    
     def test_trading_module(self) -> bool:
         """测试交易模块"""
         try:
@@ -703,30 +1054,33 @@ class OKXTradingExecutor:
             
             # 3.1 测试开多单
             write_echo("3.1 测试开多单...")
+            prior = self._position_snapshot()
             success = self._place_order("open_long", MIN_ORDER_SIZE)
             if not success:
                 write_error("开多单测试失败")
                 return False
             write_echo("开多单成功")
-            time.sleep(3)
+            self._wait_for_position_change(prior)
             
             # 3.2 测试平多单
             write_echo("3.2 测试平多单...")
+            prior = self._position_snapshot()
             success = self._close_position()
             if not success:
                 write_error("平多单测试失败")
                 return False
             write_echo("平多单成功")
-            time.sleep(3)
+            self._wait_for_position_change(prior)
             
             # 3.3 测试开空单
             write_echo("3.3 测试开空单...")
+            prior = self._position_snapshot()
             success = self._place_order("open_short", MIN_ORDER_SIZE)
             if not success:
                 write_error("开空单测试失败")
                 return False
             write_echo("开空单成功")
-            time.sleep(3)
+            self._wait_for_position_change(prior)
             
             # 3.4 测试平空单
             write_echo("3.4 测试平空单...")
@@ -786,6 +1140,8 @@ class TradingBotTester:
         except Exception as e:
             write_error(f"完整测试流程失败: {e}")
             return False
+        finally:
+            flush_logs()
     
     def test_data_collection(self) -> bool:
         """测试信息收集模块"""
@@ -819,7 +1175,7 @@ class TradingBotTester:
         """测试AI输入输出模块"""
         try:
             # 获取测试数据
-            klines = self.dc.get_kline_data()
+            klines, account_status, position_info = self.dc.fetch_cycle_data()
             current_price = klines[0]['close'] if klines else 0
             
             market_data = {
@@ -827,24 +1183,19 @@ class TradingBotTester:
                 "kline_5min": klines
             }
             
-            account_status = self.dc.get_account_balance()
-            position_info = self.dc.get_position_info()
-            
             # 记录AI输入
-            write_echo("=== AI输入数据 ===")
             input_data = {
                 "market_data": market_data,
                 "account_status": account_status,
                 "position_info": position_info
             }
-            write_echo(json.dumps(input_data, indent=2, ensure_ascii=False))
+            write_echo("=== AI输入数据 ===\n" + json_dumps(input_data, indent=True))
             
             # 获取AI决策
             ai_decision = self.ai.get_trading_decision(market_data, account_status, position_info)
             
             # 记录AI输出
-            write_echo("=== AI输出数据 ===")
-            write_echo(json.dumps(ai_decision, indent=2, ensure_ascii=False))
+            write_echo("=== AI输出数据 ===\n" + json_dumps(ai_decision, indent=True))
             
             write_echo("AI输入输出模块测试成功")
             return True
@@ -862,6 +1213,10 @@ class ETHTradingBot:
         self.ai_processor = DeepSeekAI(DEEPSEEK_API_KEY)
         self.trading_executor = OKXTradingExecutor(self.data_collector)
         self.tester = TradingBotTester(self.data_collector, self.ai_processor, self.trading_executor)
+        # 上次AI决策及对应的市场状态 (价格, 持仓方向, 持仓数量)，行情无变化时跳过AI请求
+        self._last_market_state = None
+        self._last_decision = None
+        self._reuse_count = 0
         
         write_echo("交易机器人初始化完成")
     
@@ -869,13 +1224,23 @@ class ETHTradingBot:
         """运行测试流程"""
         return self.tester.run_full_test()
     
+    def _can_reuse_decision(self, current_price: float, position_info: Dict) -> bool:
+        """上次决策为持有、持仓不变、价格变动在阈值内且未超过最大复用次数时返回True"""
+        if (self._last_decision is None or self._last_decision['trading_decision']['action'] != 'hold'
+                or self._reuse_count >= AI_MAX_REUSE_CYCLES):
+            return False
+        last_price, last_side, last_size = self._last_market_state
+        if (position_info['position_side'], position_info['position_size']) != (last_side, last_size):
+            return False
+        return last_price > 0 and abs(current_price - last_price) / last_price < AI_REUSE_PRICE_EPSILON
+    
     def run_single_cycle(self):
         """执行单个交易周期"""
         try:
             write_echo("开始交易周期")
             
-            # 1. 收集市场数据
-            klines = self.data_collector.get_kline_data()
+            # 1-3. 并发获取市场数据、账户状态和持仓信息
+            klines, account_status, position_info = self.data_collector.fetch_cycle_data()
             current_price = klines[0]['close'] if klines else 0
             
             market_data = {
@@ -883,22 +1248,33 @@ class ETHTradingBot:
                 "kline_5min": klines
             }
             
-            write_echo(f"当前价格: {current_price:.2f} USDT")
+            if self.data_collector.is_fallback_klines(klines):
+                # 行情获取失败时不基于模拟数据做决策，等待下个周期
+                write_error("行情数据获取失败，跳过本周期AI决策与交易")
+                return
             
-            # 2. 获取账户状态
-            account_status = self.data_collector.get_account_balance()
+            write_echo("当前价格: %.2f USDT", current_price)
             
-            # 3. 获取持仓信息
-            position_info = self.data_collector.get_position_info()
-            
-            # 4. AI决策
-            ai_decision = self.ai_processor.get_trading_decision(
-                market_data, account_status, position_info
-            )
+            # 4. AI决策，价格基本未变、持仓不变且上次为持有决策时直接复用
+            if self._can_reuse_decision(current_price, position_info):
+                self._reuse_count += 1
+                write_echo(f"市场状态未变化，复用上次持有决策 ({self._reuse_count}/{AI_MAX_REUSE_CYCLES})")
+                ai_decision = self._last_decision
+            else:
+                ai_decision = self.ai_processor.get_trading_decision(
+                    market_data, account_status, position_info
+                )
+                if self.ai_processor.is_fallback_decision(ai_decision):
+                    # 失败时的保守决策不缓存，同时丢弃旧缓存，下个周期重新请求AI
+                    self._last_decision = None
+                else:
+                    self._last_market_state = (current_price, position_info['position_side'], position_info['position_size'])
+                    self._last_decision = ai_decision
+                self._reuse_count = 0
             
             # 5. 执行交易
             if ai_decision:
-                success = self.trading_executor.execute_trade(ai_decision, current_price)
+                success = self.trading_executor.execute_trade(ai_decision, current_price, position_info)
                 if success:
                     write_echo("交易执行完成")
                 else:
@@ -908,24 +1284,34 @@ class ETHTradingBot:
             
         except Exception as e:
             write_error(f"交易周期执行失败: {e}")
+        finally:
+            flush_logs()
     
     def run_continuously(self):
         """持续运行"""
         write_echo("开始持续运行")
         
+        # 按单调时钟的截止时间调度，周期耗时计入间隔内，避免周期漂移
+        deadline = time.monotonic()
         while True:
             try:
+                deadline += AI_FREQUENCY
                 self.run_single_cycle()
-                write_echo(f"等待 {AI_FREQUENCY} 秒")
-                time.sleep(AI_FREQUENCY)
+                sleep_seconds = deadline - time.monotonic()
+                if sleep_seconds > 0:
+                    write_echo(f"等待 {sleep_seconds:.1f} 秒")
+                    time.sleep(sleep_seconds)
+                else:
+                    write_echo(f"交易周期超出预定间隔 {-sleep_seconds:.1f} 秒，立即开始下一周期")
+                    deadline = time.monotonic()
                 
             except KeyboardInterrupt:
                 write_echo("程序被用户中断")
                 break
             except Exception as e:
+                # 不再固定等待30秒，按调度截止时间继续下一周期
                 write_error(f"主循环异常: {e}")
-                write_echo("30秒后重试...")
-                time.sleep(30)
+                time.sleep(max(0.0, deadline - time.monotonic()))
 
 if __name__ == "__main__":
     bot = ETHTradingBot()
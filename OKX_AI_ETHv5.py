@@ -13,16 +13,34 @@ AI: Deepseek
 import os
 import time
 import hmac
-import hashlib
 import base64
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
+from logging.handlers import MemoryHandler, RotatingFileHandler
 import re
-from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional
+import random
+import ssl
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional
 import urllib.parse
 
+try:
+    import orjson  # 更快的JSON编解码，可选依赖
+except ImportError:
+    orjson = None
+
+try:
+    import websocket  # websocket-client，可选依赖
+except ImportError:
+    websocket = None
+
 # ==================== 基础配置 ====================
 OKX_API_KEY = ""
 OKX_SECRET = ""
@@ -38,6 +56,42 @@ MIN_ORDER_SIZE = 0.001
 MAX_ORDER_SIZE = 0.010
 AI_FREQUENCY = 300
 CHECK_PENDING_ORDERS_INTERVAL = 30  # 检查挂单间隔
+# K线获取失败时是否返回模拟K线；100倍杠杆下用假价格决策风险过高，默认直接报错
+ALLOW_FALLBACK_KLINE = False
+ENTRY_PRICE_TIMEOUT = 10.0  # 开仓后等待持仓均价出现的最长秒数
+ENTRY_PRICE_POLL_INTERVAL = 0.5  # 轮询持仓的间隔秒数
+# 止盈止损单验证: 首次等待、最长等待间隔与总超时(秒)，等待间隔逐次翻倍
+ALGO_VERIFY_INITIAL_DELAY = 0.1
+ALGO_VERIFY_MAX_DELAY = 0.8
+ALGO_VERIFY_TIMEOUT = 5.0
+# 止盈止损下单失败后的重试等待: 初始与最长等待(秒)，指数增长并加随机抖动
+TP_SL_RETRY_BASE_WAIT = 0.3
+TP_SL_RETRY_MAX_WAIT = 5.0
+# 测试流程等待持仓变化: 总超时与首次等待(秒)，等待间隔逐次翻倍
+POSITION_SETTLE_TIMEOUT = 3.0
+POSITION_SETTLE_INITIAL_DELAY = 0.05
+AI_RAW_LOG_LIMIT = 512  # AI原始响应仅在DEBUG级别记录，且截断到该长度
+ALGO_CANCEL_BATCH_SIZE = 20  # OKX批量撤销算法订单单次最多20个
+ACCOUNT_CACHE_TTL = 5.0  # 持仓/挂单/止盈止损查询缓存秒数，下单或撤单后立即失效
+# WebSocket订单推送配置，订单/止盈止损单状态变化时提前唤醒主循环
+# 订单频道在private端点，止盈止损(算法订单)频道只在business端点提供
+WS_PRIVATE_URL = "wss://ws.okx.com:8443/ws/v5/private"
+WS_BUSINESS_URL = "wss://ws.okx.com:8443/ws/v5/business"
+WS_RECONNECT_DELAY = 5  # 断线重连等待秒数
+WS_PING_INTERVAL = 20  # 文本ping保活间隔秒数，OKX 30秒无数据会断开连接
+
+# HTTP连接池配置
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 16
+# 连接错误对所有请求重试；读超时、限流和5xx只重试GET，避免下单请求被重复提交
+# 429响应带Retry-After时按其等待
+HTTP_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({'GET'}),
+    raise_on_status=False
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -47,22 +101,82 @@ logger = logging.getLogger()
 
 ERROR_FILE = "baocuo.txt"
 ECHO_FILE = "huixian.txt"
+LOG_MAX_BYTES = 10 << 20  # 单个日志文件上限10MB，超出后轮转
+LOG_BACKUP_COUNT = 5
+LOG_BUFFER_CAPACITY = 64  # 缓冲的日志条数，遇到ERROR立即写盘
+
+# 秒级时间由time.strftime格式化，毫秒单独拼接
+_LOG_FORMATTER = logging.Formatter(
+    '%(asctime)s.%(msecs)03d - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+def _create_file_logger(name: str, filename: str) -> logging.Logger:
+    """创建写入指定文件的日志器，文件句柄常驻，日志先缓冲再批量写入"""
+    file_handler = RotatingFileHandler(
+        filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    file_handler.setFormatter(_LOG_FORMATTER)
+    buffer_handler = MemoryHandler(
+        capacity=LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=file_handler
+    )
+    file_logger = logging.getLogger(name)
+    file_logger.setLevel(logging.INFO)
+    file_logger.addHandler(buffer_handler)
+    file_logger.propagate = False  # 不输出到控制台的根日志器
+    return file_logger
+
+echo_logger = _create_file_logger("echo", ECHO_FILE)
+error_logger = _create_file_logger("error", ERROR_FILE)
+
+# 写入报错文件/回显文件，支持logging的%s延迟格式化
+write_error = error_logger.error
+write_echo = echo_logger.info
+
+# K线字段，按列存储时的列顺序
+_KLINE_FIELDS = ("timestamp", "open", "high", "low", "close", "volume")
+
+# 模拟K线模板: (距当前分钟数, 开, 高, 低, 收, 量)，仅在ALLOW_FALLBACK_KLINE时使用
+_FALLBACK_KLINE_TEMPLATE = (
+    (15, 3500.0, 3520.0, 3490.0, 3505.0, 1500.0),
+    (10, 3505.0, 3525.0, 3495.0, 3510.0, 1200.0),
+    (5, 3510.0, 3530.0, 3500.0, 3508.0, 1800.0),
+    (0, 3508.0, 3535.0, 3505.0, 3512.0, 2000.0)
+)
 
-def write_error(message: str):
-    """写入错误信息到报错文件"""
-    try:
-        with open(ERROR_FILE, "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now()} - ERROR: {message}\n")
-    except Exception as e:
-        print(f"无法写入错误文件: {e}")
+# 并发发起互不依赖的OKX查询，共享会话连接池
+_IO_POOL = ThreadPoolExecutor(max_workers=3)
 
-def write_echo(message: str):
-    """写入回显信息到回显文件"""
-    try:
-        with open(ECHO_FILE, "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now()} - ECHO: {message}\n")
-    except Exception as e:
-        print(f"无法写入回显文件: {e}")
+def create_http_session() -> requests.Session:
+    """创建带连接池的HTTP会话，复用TCP+TLS连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=HTTP_RETRY
+    )
+    session.mount("https://", adapter)
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+def json_dumps(obj, indent: bool = False) -> str:
+    """JSON序列化，优先使用orjson，未安装时回退标准库"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(',', ':'))
+
+def json_dumpb(obj) -> bytes:
+    """JSON序列化为UTF-8字节，用作请求体，orjson可直接输出字节"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def json_loads(data):
+    """JSON反序列化，支持str和bytes，优先使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 # ==================== 模块1: 信息收集模块 ====================
 class OKXDataCollector:
@@ -72,27 +186,24 @@ class OKXDataCollector:
         self.api_key = api_key
         self.secret = secret
         self.password = password
+        self._secret_bytes = secret.encode('utf-8')  # 签名密钥只编码一次
+        # GET查询结果缓存: (endpoint, 参数) -> (过期时间, 数据)
+        self._cache: Dict[tuple, tuple] = {}
+        self._cache_lock = threading.Lock()
+        # 缓存代数，每次失效加1；请求期间缓存被清空过则不写入请求结果
+        self._cache_generation = 0
         self.base_url = "https://www.okx.com"
+        self.session = create_http_session()
+        # 固定的认证头只设置一次，每次请求仅附带签名和时间戳
+        self.session.headers.update({
+            'OK-ACCESS-KEY': self.api_key,
+            'OK-ACCESS-PASSPHRASE': self.password
+        })
         
-    def _generate_signature(self, timestamp: str, method: str, request_path: str, body: str = "") -> str:
-        """生成OKX API签名"""
-        try:
-            if body is None:
-                body = ""
-                
-            message = timestamp + method.upper() + request_path + body
-            
-            mac = hmac.new(
-                bytes(self.secret, encoding='utf-8'),
-                bytes(message, encoding='utf-8'),
-                digestmod='sha256'
-            )
-            signature = base64.b64encode(mac.digest()).decode()
-            return signature
-            
-        except Exception as e:
-            write_error(f"生成签名失败: {e}")
-            raise
+    def _generate_signature(self, timestamp: str, method: str, request_path: str, body: bytes = b"") -> str:
+        """生成OKX API签名，异常由调用方_make_request统一记录"""
+        message = (timestamp + method.upper() + request_path).encode('utf-8') + (body or b"")
+        return base64.b64encode(hmac.digest(self._secret_bytes, message, 'sha256')).decode()
     
     def _get_timestamp(self) -> str:
         """获取OKX格式的时间戳"""
@@ -108,35 +219,33 @@ class OKXDataCollector:
             url = self.base_url + endpoint
             
             timestamp = self._get_timestamp()
-            body = ""
+            body = b""
             
             # 处理GET请求参数
             if method.upper() == 'GET' and params:
-                query_string = '&'.join([f"{k}={v}" for k, v in params.items()])
-                request_path = endpoint + '?' + query_string
+                query_string = urllib.parse.urlencode(params)
+                request_path = f"{endpoint}?{query_string}"
                 url = self.base_url + request_path
-            elif method.upper() == 'POST' and params:
-                body = json.dumps(params, separators=(',', ':'))
+            elif method.upper() == 'POST':
+                # 下单/撤单会改变账户状态，清空查询缓存
+                self.invalidate()
+                if params:
+                    # 请求体只编码一次，签名与发送使用同一份字节
+                    body = json_dumpb(params)
             
             signature = self._generate_signature(timestamp, method.upper(), request_path, body)
             
             headers = {
-                'OK-ACCESS-KEY': self.api_key,
                 'OK-ACCESS-SIGN': signature,
-                'OK-ACCESS-TIMESTAMP': timestamp,
-                'OK-ACCESS-PASSPHRASE': self.password,
-                'Content-Type': 'application/json'
+                'OK-ACCESS-TIMESTAMP': timestamp
             }
             
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers, timeout=10)
-            else:
-                response = requests.post(url, headers=headers, data=body, timeout=10)
+            response = self.session.request(method.upper(), url, headers=headers, data=body or None, timeout=10)
             
-            write_echo(f"API请求: {method} {endpoint} - 状态码: {response.status_code}")
+            write_echo("API请求: %s %s - 状态码: %s", method, endpoint, response.status_code)
             
             response.raise_for_status()
-            result = response.json()
+            result = json_loads(response.content)
             
             if result['code'] != '0':
                 error_msg = f"API错误: {result['msg']} (代码: {result['code']})"
@@ -153,6 +262,29 @@ class OKXDataCollector:
             write_error(f"API请求失败: {e}")
             raise
     
+    def _cached_get(self, endpoint: str, params: Optional[Dict], ttl: float) -> Any:
+        """带TTL缓存的GET请求，缓存未过期时直接返回上次结果"""
+        key = (endpoint, tuple(sorted(params.items())) if params else ())
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            generation = self._cache_generation
+        if entry is not None and now < entry[0]:
+            return entry[1]
+        
+        data = self._make_request('GET', endpoint, params)
+        with self._cache_lock:
+            # 请求期间收到成交推送或下单撤单，结果可能是旧状态，不缓存
+            if generation == self._cache_generation:
+                self._cache[key] = (now + ttl, data)
+        return data
+    
+    def invalidate(self):
+        """清空查询缓存，下单或撤单后调用"""
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_generation += 1
+    
     def get_kline_data(self, symbol: str = SYMBOL, bar: str = "5m", limit: int = 4) -> List[Dict]:
         """获取K线数据"""
         try:
@@ -164,59 +296,37 @@ class OKXDataCollector:
             }
             
             data = self._make_request('GET', endpoint, params)
-            klines = []
-            
-            for candle in data:
-                klines.append({
-                    "timestamp": datetime.fromtimestamp(int(candle[0])/1000).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": float(candle[1]),
-                    "high": float(candle[2]),
-                    "low": float(candle[3]),
-                    "close": float(candle[4]),
-                    "volume": float(candle[5])
-                })
+            klines = [
+                {
+                    "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(int(ts) // 1000)),
+                    "open": float(o),
+                    "high": float(h),
+                    "low": float(l),
+                    "close": float(c),
+                    "volume": float(v)
+                }
+                for ts, o, h, l, c, v, *_ in data
+            ]
             
             write_echo(f"获取K线数据成功: {len(klines)}根")
             return klines
             
         except Exception as e:
             write_error(f"获取K线数据失败: {e}")
-            # 返回模拟数据避免程序中断
-            current_time = datetime.now()
-            base_price = 3500.0
+            if not ALLOW_FALLBACK_KLINE:
+                raise RuntimeError(f"获取K线数据失败: {e}") from e
+            # 返回模拟数据避免程序中断，只需填入时间戳
+            now = time.time()
             return [
                 {
-                    "timestamp": (current_time - timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price,
-                    "high": base_price + 20,
-                    "low": base_price - 10,
-                    "close": base_price + 5,
-                    "volume": 1500.0
-                },
-                {
-                    "timestamp": (current_time - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 5,
-                    "high": base_price + 25,
-                    "low": base_price - 5,
-                    "close": base_price + 10,
-                    "volume": 1200.0
-                },
-                {
-                    "timestamp": (current_time - timedelta(minutes=5)).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 10,
-                    "high": base_price + 30,
-                    "low": base_price,
-                    "close": base_price + 8,
-                    "volume": 1800.0
-                },
-                {
-                    "timestamp": current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + 8,
-                    "high": base_price + 35,
-                    "low": base_price + 5,
-                    "close": base_price + 12,
-                    "volume": 2000.0
+                    "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now - offset * 60)),
+                    "open": o,
+                    "high": h,
+                    "low": l,
+                    "close": c,
+                    "volume": v
                 }
+                for offset, o, h, l, c, v in _FALLBACK_KLINE_TEMPLATE
             ]
     
     def get_current_price(self) -> float:
@@ -234,7 +344,7 @@ class OKXDataCollector:
         """获取账户余额信息"""
         try:
             endpoint = "/api/v5/account/balance"
-            data = self._make_request('GET', endpoint)
+            data = self._cached_get(endpoint, None, ACCOUNT_CACHE_TTL)
             
             if not data:
                 raise Exception("账户数据为空")
@@ -256,12 +366,12 @@ class OKXDataCollector:
                 "total_equity": 4.52
             }
     
-    def get_position_info(self, symbol: str = SYMBOL) -> Dict:
-        """获取持仓信息"""
+    def get_position_info(self, symbol: str = SYMBOL, cache_ttl: float = ACCOUNT_CACHE_TTL) -> Dict:
+        """获取持仓信息，cache_ttl为0时强制查询最新持仓"""
         try:
             endpoint = "/api/v5/account/positions"
             params = {'instId': symbol}
-            data = self._make_request('GET', endpoint, params)
+            data = self._cached_get(endpoint, params, cache_ttl)
             
             position_data = {
                 "position_side": "flat",
@@ -294,13 +404,13 @@ class OKXDataCollector:
                 "leverage": LEVERAGE
             }
 
-    def get_algo_orders(self, algo_id: str = None) -> List[Dict]:
-        """获取算法订单（止盈止损单）状态"""
+    def get_algo_orders(self, algo_id: str = None, cache_ttl: float = ACCOUNT_CACHE_TTL) -> List[Dict]:
+        """获取算法订单（止盈止损单）状态，cache_ttl为0时强制查询"""
         try:
             endpoint = "/api/v5/trade/orders-algo-pending"
             params = {
                 'instType': 'SWAP',
-                'ordType': 'conditional'
+                'ordType': 'conditional,oco'  # 止盈止损以OCO单挂出，两种类型一并查询
             }
             
             if algo_id:
@@ -308,40 +418,58 @@ class OKXDataCollector:
             else:
                 params['instId'] = SYMBOL
             
-            data = self._make_request('GET', endpoint, params)
+            data = self._cached_get(endpoint, params, cache_ttl)
             return data
         except Exception as e:
             write_error(f"获取算法订单失败: {e}")
             return []
 
-    def get_pending_orders(self, symbol: str = SYMBOL) -> List[Dict]:
+    def get_pending_orders(self, symbol: str = SYMBOL, cache_ttl: float = ACCOUNT_CACHE_TTL) -> List[Dict]:
         """获取待成交订单"""
         try:
             endpoint = "/api/v5/trade/orders-pending"
             params = {'instId': symbol}
-            data = self._make_request('GET', endpoint, params)
+            data = self._cached_get(endpoint, params, cache_ttl)
             return data
         except Exception as e:
             write_error(f"获取待成交订单失败: {e}")
             return []
 
+    def get_kline_soa(self, symbol: str = SYMBOL, bar: str = "5m", limit: int = 4) -> Dict[str, list]:
+        """获取按列存储的K线数据，每个字段一个列表，AI提示词中不再重复字段名"""
+        klines = self.get_kline_data(symbol, bar, limit)
+        return {field: [k[field] for k in klines] for field in _KLINE_FIELDS}
+
+    def fetch_cycle_data(self) -> tuple:
+        """并发获取一个周期所需的按列K线、账户余额和持仓信息；持仓与余额走查询缓存，
+        紧跟在挂单检查之后调用时复用同一份持仓结果"""
+        f_klines = _IO_POOL.submit(self.get_kline_soa)
+        f_balance = _IO_POOL.submit(self.get_account_balance)
+        f_position = _IO_POOL.submit(self.get_position_info)
+        return f_klines.result(), f_balance.result(), f_position.result()
+
     def has_pending_orders_or_tpsl(self) -> bool:
         """检查是否存在挂单或止盈止损单"""
         try:
+            # 三个查询互不依赖，并发发起，结果按原顺序判断
+            f_pending = _IO_POOL.submit(self.get_pending_orders)
+            f_algo = _IO_POOL.submit(self.get_algo_orders)
+            f_position = _IO_POOL.submit(self.get_position_info)
+            
             # 检查待成交订单
-            pending_orders = self.get_pending_orders()
+            pending_orders = f_pending.result()
             if pending_orders and len(pending_orders) > 0:
                 write_echo(f"存在 {len(pending_orders)} 个待成交订单")
                 return True
             
             # 检查算法订单（止盈止损）
-            algo_orders = self.get_algo_orders()
+            algo_orders = f_algo.result()
             if algo_orders and len(algo_orders) > 0:
                 write_echo(f"存在 {len(algo_orders)} 个止盈止损订单")
                 return True
             
             # 检查持仓
-            position_info = self.get_position_info()
+            position_info = f_position.result()
             if position_info["position_size"] > 0:
                 write_echo(f"存在持仓: {position_info['position_side']} {position_info['position_size']} ETH")
                 return True
@@ -353,30 +481,30 @@ class OKXDataCollector:
             write_error(f"检查挂单状态失败: {e}")
             return False  # 出错时假设没有挂单，继续执行
 
+    def cancel_algo_orders(self, algo_ids: List[str], inst_id: str = SYMBOL) -> int:
+        """批量撤销算法订单（止盈止损单），每次请求最多ALGO_CANCEL_BATCH_SIZE个，返回成功撤销数量"""
+        endpoint = "/api/v5/trade/cancel-algos"
+        success_count = 0
+        for i in range(0, len(algo_ids), ALGO_CANCEL_BATCH_SIZE):
+            batch = algo_ids[i:i + ALGO_CANCEL_BATCH_SIZE]
+            params = [{'algoId': algo_id, 'instId': inst_id} for algo_id in batch]
+            try:
+                self._make_request('POST', endpoint, params)
+                success_count += len(batch)
+                write_echo(f"撤销算法订单成功, AlgoID: {', '.join(batch)}")
+            except Exception as e:
+                write_error(f"撤销算法订单失败: {e} - AlgoID: {', '.join(batch)}")
+        return success_count
+
     def cancel_algo_order(self, algo_id: str, inst_id: str = SYMBOL) -> bool:
-        """撤销算法订单（止盈止损单）"""
-        try:
-            endpoint = "/api/v5/trade/cancel-algos"
-            params = [
-                {
-                    'algoId': algo_id,
-                    'instId': inst_id
-                }
-            ]
-            
-            result = self._make_request('POST', endpoint, params)
-            write_echo(f"撤销算法订单成功, AlgoID: {algo_id}")
-            return True
-            
-        except Exception as e:
-            write_error(f"撤销算法订单失败: {e}")
-            return False
+        """撤销单个算法订单（止盈止损单）"""
+        return self.cancel_algo_orders([algo_id], inst_id) == 1
 
     def cancel_all_algo_orders(self, inst_id: str = SYMBOL) -> bool:
         """撤销指定交易对的所有算法订单"""
         try:
             # 先获取所有待处理的算法订单
-            algo_orders = self.get_algo_orders()
+            algo_orders = self.get_algo_orders(cache_ttl=0)
             if not algo_orders:
                 write_echo("没有找到待处理的算法订单")
                 return True
@@ -390,15 +518,8 @@ class OKXDataCollector:
             
             write_echo(f"找到 {len(target_orders)} 个待处理的算法订单，开始撤销...")
             
-            # 逐个撤销
-            success_count = 0
-            for order in target_orders:
-                try:
-                    if self.cancel_algo_order(order['algoId'], inst_id):
-                        success_count += 1
-                    time.sleep(0.5)  # 避免频率限制
-                except Exception as e:
-                    write_error(f"撤销订单 {order['algoId']} 失败: {e}")
+            # 批量撤销
+            success_count = self.cancel_algo_orders([order['algoId'] for order in target_orders], inst_id)
             
             write_echo(f"成功撤销 {success_count} 个算法订单")
             return success_count == len(target_orders)
@@ -407,34 +528,117 @@ class OKXDataCollector:
             write_error(f"撤销所有算法订单失败: {e}")
             return False
 
-# ==================== 模块2: AI输入模块 ====================
-class DeepSeekAI:
-    """DeepSeek AI交易决策"""
+class OKXOrderStream:
+    """OKX私有频道订阅：订单或止盈止损单状态变化时唤醒主循环，未启用或断线时回退定时轮询"""
     
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://api.deepseek.com/v1/chat/completions"
-        self.last_profit = 0.0  # 记录上次策略盈利
+    def __init__(self, data_collector: OKXDataCollector, symbol: str = SYMBOL):
+        self.dc = data_collector
+        self.symbol = symbol
+        self.changed = threading.Event()
     
-    def get_trading_decision(self, market_data: Dict, account_status: Dict, position_info: Dict) -> Dict:
-        """获取AI交易决策"""
-        try:
-            # 在AI请求前记录账户状态和持仓信息
-            write_echo("=== AI请求账户状态 ===")
-            write_echo(f"可用余额: {account_status['available_OKX']:.6f} USDT")
-            write_echo(f"账户总权益: {account_status['total_equity']:.6f} USDT")
-            write_echo(f"上次策略盈利: {self.last_profit:.6f} USDT")
-            
-            # 构建AI提示词 - 优化版模板
-            prompt = self._build_prompt(market_data, account_status, position_info)
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {self.api_key}'
-            }
-            
-            # 优化的系统提示词
-            system_prompt = """角色定位：你是顶级量化竞技AI交易员，专注于OKX交易所的ETH永续合约交易，并且与其他AI交易员互相竞争
+    def start(self) -> bool:
+        """为订单频道和止盈止损频道各启动一个后台连接线程"""
+        if websocket is None:
+            write_echo("未安装websocket-client，使用REST轮询")
+            return False
+        
+        for url, channel in ((WS_PRIVATE_URL, "orders"), (WS_BUSINESS_URL, "orders-algo")):
+            threading.Thread(target=self._run_forever, args=(url, channel), name=f"ws-{channel}", daemon=True).start()
+        write_echo("WebSocket订单推送已启动")
+        return True
+    
+    def wait(self, timeout: float) -> bool:
+        """最多等待timeout秒，期间收到订单状态推送则立即返回True"""
+        return self.changed.wait(timeout)
+    
+    def _run_forever(self, url: str, channel: str):
+        """保持连接，断线后自动重连"""
+        while True:
+            try:
+                ws_app = websocket.WebSocketApp(
+                    url,
+                    on_open=self._on_open,
+                    on_message=lambda ws, message: self._on_message(ws, message, channel)
+                )
+                ws_app.run_forever()
+            except Exception as e:
+                write_error(f"WebSocket连接异常: {e}")
+            time.sleep(WS_RECONNECT_DELAY)
+    
+    def _on_open(self, ws):
+        # 私有频道需先登录，签名规则与REST一致
+        timestamp = str(int(time.time()))
+        sign = self.dc._generate_signature(timestamp, 'GET', '/users/self/verify')
+        ws.send(json_dumps({
+            "op": "login",
+            "args": [{
+                "apiKey": self.dc.api_key,
+                "passphrase": self.dc.password,
+                "timestamp": timestamp,
+                "sign": sign
+            }]
+        }))
+        threading.Thread(target=self._keepalive, args=(ws,), name="ws-ping", daemon=True).start()
+    
+    def _keepalive(self, ws):
+        """按OKX要求定时发送文本ping，超过两个间隔未收到pong时主动断开以触发重连"""
+        ws.last_pong = time.monotonic()
+        while ws.keep_running:
+            time.sleep(WS_PING_INTERVAL)
+            if time.monotonic() - ws.last_pong > 2 * WS_PING_INTERVAL:
+                write_error("WebSocket保活超时，重新连接")
+                ws.close()
+                return
+            try:
+                ws.send('ping')
+            except Exception:
+                return
+    
+    def _on_message(self, ws, message: str, channel: str):
+        if message == 'pong':
+            ws.last_pong = time.monotonic()
+            return
+        msg = json_loads(message)
+        event = msg.get('event')
+        
+        if event == 'login':
+            if msg.get('code') == '0':
+                ws.send(json_dumps({"op": "subscribe", "args": [
+                    {"channel": channel, "instType": "SWAP", "instId": self.symbol}
+                ]}))
+            else:
+                write_error(f"WebSocket登录失败: {msg.get('msg')}")
+        elif event == 'error':
+            write_error(f"WebSocket错误: {msg.get('msg')} (代码: {msg.get('code')})")
+        elif msg.get('data'):
+            # 订单成交、止盈止损触发或撤销：清空查询缓存并唤醒主循环
+            self.dc.invalidate()
+            self.changed.set()
+
+# ==================== 模块2: AI输入模块 ====================
+# 手动构建决策时使用的正则，模块加载时编译一次
+_ACTION_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'"action"\s*:\s*"(\w+)"',
+    r'action["\']?\s*:\s*["\']?(\w+)',
+    r'操作["\']?\s*:\s*["\']?(\w+)'
+))
+_REASON_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'"reason"\s*:\s*"([^"]*)"',
+    r'reason["\']?\s*:\s*["\']?([^"\']+)',
+    r'理由["\']?\s*:\s*["\']?([^"\']+)'
+))
+
+# 决策格式校验使用的字段与取值集合（已移除平仓操作）
+_REQUIRED_TD = frozenset({"action", "confidence_level", "reason"})
+_REQUIRED_PM = frozenset({"position_size", "stop_loss_price", "take_profit_price"})
+_VALID_ACTIONS = frozenset({"hold", "open_long", "open_short"})
+_VALID_CONFIDENCES = frozenset({"high", "medium", "low"})
+
+# 换行和制表符替换为空格，兼容AI在字符串值中直接换行的情况
+_WS_TRANS = str.maketrans('\n\t', '  ')
+
+# 系统提示词模板，账户状态与上次盈利在每次请求时填入
+_SYSTEM_PROMPT = """角色定位：你是顶级量化竞技AI交易员，专注于OKX交易所的ETH永续合约交易，并且与其他AI交易员互相竞争
 核心目标：在小资金实盘环境下，通过精准策略在激烈竞争中保持优势并实现稳定盈利
 环境认知：
 1. 充满顶级AI对手的高效衍生品市场
@@ -453,17 +657,18 @@ class DeepSeekAI:
 - 可用余额: {available_OKX} USDT
 - 账户总权益: {total_equity} USDT
 2. 上次策略的盈利为 {last_profit} USDT(亏损时为负数)
-3. 策略框架
+3. K线数据kline_5min按列给出，各列相同下标对应同一根K线，按时间从新到旧排列
+4. 策略框架
 - 多时间维度分析(1m/5m/1h/4h)
 - 链上数据与市场情绪结合
 - 动态参数调整与风险暴露控制
 - 反侦察策略保护(避免典型模式)
-4. 风险管理
+5. 风险管理
 - 单次风险暴露不超过总资金的30%
 - 总持仓风险不超过总资金的10%
 - 实时监控策略衰减信号
 - 保持策略多样性和快速切换能力
-5. 执行要求
+6. 执行要求
 - 小资金仓位管理
 - 持续的市场适应性学习
 基于以上信息和你通过联网查询了解到的所有信息，按照如下Json进行回显来进行实盘操作。
@@ -479,9 +684,31 @@ class DeepSeekAI:
     "take_profit_price": 3580.0              // 建议止盈价格(USDT)
   }}
 }}"""
+
+class DeepSeekAI:
+    """DeepSeek AI交易决策"""
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.base_url = "https://api.deepseek.com/v1/chat/completions"
+        self.session = create_http_session()
+        self.session.headers['Authorization'] = f'Bearer {self.api_key}'
+        self.last_profit = 0.0  # 记录上次策略盈利
+    
+    def get_trading_decision(self, market_data: Dict, account_status: Dict, position_info: Dict) -> Dict:
+        """获取AI交易决策"""
+        try:
+            # 在AI请求前记录账户状态和持仓信息
+            write_echo("=== AI请求账户状态 ===")
+            write_echo("可用余额: %.6f USDT", account_status['available_OKX'])
+            write_echo("账户总权益: %.6f USDT", account_status['total_equity'])
+            write_echo("上次策略盈利: %.6f USDT", self.last_profit)
+            
+            # 构建AI提示词 - 优化版模板
+            prompt = self._build_prompt(market_data, account_status, position_info)
             
             # 格式化系统提示词
-            formatted_system_prompt = system_prompt.format(
+            formatted_system_prompt = _SYSTEM_PROMPT.format(
                 available_OKX=account_status["available_OKX"],
                 total_equity=account_status["total_equity"],
                 last_profit=self.last_profit
@@ -503,28 +730,30 @@ class DeepSeekAI:
                 "max_tokens": 2000
             }
             
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
+            response = self.session.post(self.base_url, data=json_dumpb(payload), timeout=30)
             response.raise_for_status()
-            result = response.json()
+            result = json_loads(response.content)
             
             ai_response = result['choices'][0]['message']['content']
             write_echo("AI原始响应接收成功")
             
-            # 记录AI原始响应到回显文件以便调试
-            write_echo(f"AI原始响应: {ai_response}")
+            # 调试时将回显日志级别设为DEBUG即可记录AI原始响应
+            echo_logger.debug("AI原始响应: %s", ai_response[:AI_RAW_LOG_LIMIT])
             
             decision = self._parse_ai_response(ai_response)
             
             # 记录AI决策详细信息
             write_echo("=== AI交易决策 ===")
-            write_echo(f"操作类型: {decision['trading_decision']['action']}")
-            write_echo(f"信心等级: {decision['trading_decision']['confidence_level']}")
-            write_echo(f"决策理由: {decision['trading_decision']['reason']}")
-            write_echo(f"建议仓位: {decision['position_management']['position_size']:.6f} ETH")
-            write_echo(f"建议止盈: {decision['position_management']['take_profit_price']:.2f} USDT")
-            write_echo(f"建议止损: {decision['position_management']['stop_loss_price']:.2f} USDT")
-            
-            action = decision['trading_decision']['action']
+            td = decision['trading_decision']
+            pm = decision['position_management']
+            write_echo("操作类型: %s", td['action'])
+            write_echo("信心等级: %s", td['confidence_level'])
+            write_echo("决策理由: %s", td['reason'])
+            write_echo("建议仓位: %.6f ETH", pm['position_size'])
+            write_echo("建议止盈: %.2f USDT", pm['take_profit_price'])
+            write_echo("建议止损: %.2f USDT", pm['stop_loss_price'])
+            
+            action = td['action']
             if action in ['open_long', 'open_short']:
                 write_echo("📈 开仓信号")
             else:
@@ -568,37 +797,33 @@ class DeepSeekAI:
             }
         }
         
-        return json.dumps(input_data, indent=2, ensure_ascii=False)
+        return json_dumps(input_data, indent=True)
 
     def _parse_ai_response(self, response: str) -> Dict:
         """解析AI响应 - 优化解析能力"""
         try:
             # 首先尝试直接解析整个响应
             try:
-                decision = json.loads(response)
+                decision = json_loads(response)
                 if self._validate_decision_format(decision):
                     return decision
             except:
                 pass
             
-            # 如果直接解析失败，尝试提取符合我们模板的JSON部分
-            pattern = r'\{\s*"trading_decision"\s*:\s*\{[^{}]*\},\s*"position_management"\s*:\s*\{[^{}]*\}\s*\}'
-            matches = re.findall(pattern, response, re.DOTALL)
-            
-            for match in matches:
+            # 如果直接解析失败，依次提取响应中的顶层JSON对象
+            start = response.find('{')
+            while start != -1:
+                json_str = self._extract_first_json(response, start)
+                if json_str is None:
+                    break
                 try:
-                    # 清理JSON字符串
-                    json_str = match.replace('\n', ' ').replace('\t', ' ')
-                    # 移除多余的空白字符
-                    json_str = re.sub(r'\s+', ' ', json_str).strip()
-                    
-                    decision = json.loads(json_str)
+                    decision = json_loads(json_str.translate(_WS_TRANS))
                     if self._validate_decision_format(decision):
                         write_echo("从响应中成功提取标准JSON决策")
                         return decision
                 except Exception as e:
                     write_error(f"提取的JSON解析失败: {e}")
-                    continue
+                start = response.find('{', start + len(json_str))
             
             # 如果正则匹配失败，尝试手动构建标准格式
             write_echo("尝试手动构建标准格式决策")
@@ -620,6 +845,31 @@ class DeepSeekAI:
                 }
             }
     
+    @staticmethod
+    def _extract_first_json(text: str, start: int) -> Optional[str]:
+        """从start处的'{'开始线性扫描，跳过字符串内的括号，返回配对完整的JSON对象文本"""
+        depth = 0
+        in_string = False
+        escape = False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == '\\':
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        return None
+    
     def _build_standard_decision_from_response(self, response: str) -> Dict:
         """从AI响应中手动构建标准格式决策"""
         try:
@@ -638,30 +888,17 @@ class DeepSeekAI:
             }
             
             # 尝试从响应中提取action
-            action_patterns = [
-                r'"action"\s*:\s*"(\w+)"',
-                r'action["\']?\s*:\s*["\']?(\w+)',
-                r'操作["\']?\s*:\s*["\']?(\w+)'
-            ]
-            
-            for pattern in action_patterns:
-                match = re.search(pattern, response, re.IGNORECASE)
+            for pattern in _ACTION_PATTERNS:
+                match = pattern.search(response)
                 if match:
                     action = match.group(1).lower()
-                    valid_actions = ["hold", "open_long", "open_short"]  # 移除了平仓操作
-                    if action in valid_actions:
+                    if action in _VALID_ACTIONS:
                         decision["trading_decision"]["action"] = action
                         break
             
             # 尝试提取reason
-            reason_patterns = [
-                r'"reason"\s*:\s*"([^"]*)"',
-                r'reason["\']?\s*:\s*["\']?([^"\']+)',
-                r'理由["\']?\s*:\s*["\']?([^"\']+)'
-            ]
-            
-            for pattern in reason_patterns:
-                match = re.search(pattern, response, re.IGNORECASE)
+            for pattern in _REASON_PATTERNS:
+                match = pattern.search(response)
                 if match:
                     reason = match.group(1).strip()
                     if reason:
@@ -689,25 +926,12 @@ class DeepSeekAI:
             td = decision["trading_decision"]
             pm = decision["position_management"]
             
-            if not all(field in td for field in ["action", "confidence_level", "reason"]):
-                return False
-                
-            if not all(field in pm for field in ["position_size", "stop_loss_price", "take_profit_price"]):
-                return False
-                
-            # 验证action值的有效性（移除了平仓操作）
-            valid_actions = ["hold", "open_long", "open_short"]
-            if td["action"] not in valid_actions:
-                return False
-                
-            # 验证confidence_level值的有效性
-            valid_confidences = ["high", "medium", "low"]
-            if td["confidence_level"] not in valid_confidences:
-                return False
-                
-            return True
+            # 字段齐全且action、confidence_level取值有效
+            return (td.keys() >= _REQUIRED_TD and pm.keys() >= _REQUIRED_PM
+                    and td["action"] in _VALID_ACTIONS
+                    and td["confidence_level"] in _VALID_CONFIDENCES)
             
-        except:
+        except (KeyError, TypeError, AttributeError):
             return False
 
     def update_profit(self, profit: float):
@@ -715,13 +939,61 @@ class DeepSeekAI:
         self.last_profit = profit
 
 # ==================== 模块4: 交易执行模块 ====================
+PRICE_TICK = Decimal("0.01")  # ETH-USDT-SWAP价格精度
+
+@lru_cache(maxsize=256)
+def _format_price(price: float) -> str:
+    """按价格精度四舍五入为字符串，避免str(float)产生60123.45000000001这类超精度价格被拒单"""
+    return str(Decimal(str(price)).quantize(PRICE_TICK, rounding=ROUND_HALF_UP))
+
+@lru_cache(maxsize=64)
+def _eth_to_contracts(eth_size: float) -> str:
+    """
+    将ETH数量转换为合约张数
+    根据诊断结果，合约面值ctVal=0.1，所以1张=0.1 ETH
+    最小下单数量minSz=0.01张
+    下单数量只有少数几种取值，结果缓存复用
+    """
+    CONTRACT_VALUE = 0.1  # 每张合约代表的ETH数量
+    MIN_CONTRACT_SIZE = 0.01  # 最小下单张数
+    
+    # 计算张数
+    contracts = eth_size / CONTRACT_VALUE
+    
+    # 验证是否满足最小下单要求
+    if contracts < MIN_CONTRACT_SIZE:
+        raise ValueError(f"转换后的张数({contracts:.4f})小于最小要求({MIN_CONTRACT_SIZE})")
+    
+    # 格式化为字符串，保留小数点后2位（因为最小精度是0.01）
+    return f"{contracts:.2f}"
+
 class OKXTradingExecutor:
     """OKX交易执行器"""
     
+    # 订单参数模板，下单时复制并填入数量/触发价；posSide为关键修复：添加持仓方向参数
+    _OPEN_TEMPLATES = {
+        "open_long": {'instId': SYMBOL, 'tdMode': 'cross', 'side': 'buy', 'ordType': 'market',
+                      'lever': str(LEVERAGE), 'posSide': 'long'},
+        "open_short": {'instId': SYMBOL, 'tdMode': 'cross', 'side': 'sell', 'ordType': 'market',
+                       'lever': str(LEVERAGE), 'posSide': 'short'}
+    }
+    _CLOSE_TEMPLATES = {
+        "close_long": {'instId': SYMBOL, 'tdMode': 'cross', 'side': 'sell', 'ordType': 'market', 'posSide': 'long'},
+        "close_short": {'instId': SYMBOL, 'tdMode': 'cross', 'side': 'buy', 'ordType': 'market', 'posSide': 'short'}
+    }
+    # 止盈止损OCO单：多单止盈止损都是卖出，空单都是买入，-1表示市价
+    _TP_SL_TEMPLATES = {
+        "long": {'instId': SYMBOL, 'tdMode': 'cross', 'side': 'sell', 'ordType': 'oco',
+                 'tpOrdPx': '-1', 'slOrdPx': '-1', 'posSide': 'long'},
+        "short": {'instId': SYMBOL, 'tdMode': 'cross', 'side': 'buy', 'ordType': 'oco',
+                  'tpOrdPx': '-1', 'slOrdPx': '-1', 'posSide': 'short'}
+    }
+    
     def __init__(self, data_collector: OKXDataCollector, ai_processor: DeepSeekAI):
         self.dc = data_collector
         self.ai = ai_processor
         self.current_tp_sl_orders = {}  # 存储当前止盈止损订单ID
+        self.last_order_id = None  # 最近一次开仓市价单的订单ID，用于直接读取成交均价
     
     def execute_trade(self, decision: Dict, current_price: float, is_test: bool = False) -> bool:
         """执行交易决策 - 优化版本，只处理开仓"""
@@ -745,10 +1017,8 @@ class OKXTradingExecutor:
                     success = self._place_order(action, position_size)
                     if success:
                         write_echo("✅ 开仓成功")
-                        # 等待5秒后下止盈止损单
-                        time.sleep(5)
                         
-                        # 获取实际的开仓价格
+                        # 立即轮询实际的开仓价格，成交后尽快下止盈止损单
                         entry_price = self._get_entry_price_with_retry()
                         if entry_price is None:
                             write_error("无法获取开仓价格，使用当前价格")
@@ -805,22 +1075,39 @@ class OKXTradingExecutor:
             write_error(f"执行交易失败: {e}")
             return False
     
-    def _get_entry_price_with_retry(self, max_retries: int = 5, wait_seconds: int = 2) -> float:
-        """重试获取开仓价格"""
-        for attempt in range(max_retries):
+    def _get_entry_price_with_retry(self, timeout: float = ENTRY_PRICE_TIMEOUT,
+                                    poll_interval: float = ENTRY_PRICE_POLL_INTERVAL) -> float:
+        """获取开仓价格：优先读取开仓订单的成交均价，未成交时轮询持仓，超时返回None"""
+        if self.last_order_id:
+            fill_price = self._get_order_fill_price(self.last_order_id)
+            if fill_price:
+                return fill_price
+        
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            attempt += 1
             try:
-                position_info = self.dc.get_position_info()
+                position_info = self.dc.get_position_info(cache_ttl=0)
                 if position_info["position_size"] > 0 and position_info["entry_price"] > 0:
                     return position_info["entry_price"]
-                else:
-                    write_echo(f"未获取到有效开仓价格，重试 {attempt + 1}/{max_retries}")
             except Exception as e:
-                write_error(f"获取开仓价格失败 (尝试 {attempt + 1}): {e}")
+                write_error(f"获取开仓价格失败 (尝试 {attempt}): {e}")
             
-            if attempt < max_retries - 1:
-                time.sleep(wait_seconds)
-        
-        return None
+            if time.monotonic() + poll_interval >= deadline:
+                write_echo(f"{timeout:.0f}秒内未获取到有效开仓价格，共尝试 {attempt} 次")
+                return None
+            time.sleep(poll_interval)
+    
+    def _get_order_fill_price(self, ord_id: str) -> Optional[float]:
+        """查询订单成交均价，市价单通常在下单返回时已成交；未成交或查询失败返回None"""
+        try:
+            data = self.dc._make_request('GET', "/api/v5/trade/order", {'instId': SYMBOL, 'ordId': ord_id})
+            avg_px = data[0].get('avgPx') if data else None
+            return float(avg_px) if avg_px else None
+        except Exception as e:
+            write_error(f"查询订单成交价格失败: {e}")
+            return None
     
     def _place_tp_sl_orders_with_retry(self, pos_side: str, eth_size: float, tp_price: float, sl_price: float, max_retries: int = 5) -> bool:
         """下止盈止损单并重试直到成功"""
@@ -830,21 +1117,18 @@ class OKXTradingExecutor:
             
         for attempt in range(max_retries):
             try:
-                write_echo(f"尝试设置止盈止损 (尝试 {attempt + 1}/{max_retries})")
-                write_echo(f"止盈价格: {tp_price:.2f}, 止损价格: {sl_price:.2f}")
+                write_echo("尝试设置止盈止损 (尝试 %d/%d)", attempt + 1, max_retries)
+                write_echo("止盈价格: %.2f, 止损价格: %.2f", tp_price, sl_price)
                 
                 algo_ids = self._place_tp_sl_order(pos_side, eth_size, tp_price, sl_price)
                 
                 if algo_ids:
                     # 存储订单ID
                     self.current_tp_sl_orders = algo_ids
-                    write_echo(f"止盈止损设置成功: 止盈{tp_price:.2f}, 止损{sl_price:.2f}")
-                    
-                    # 等待5秒后验证
-                    time.sleep(5)
+                    write_echo("止盈止损设置成功: 止盈%.2f, 止损%.2f", tp_price, sl_price)
                     
-                    # 验证订单是否存在
-                    if self._verify_tp_sl_orders_exist(algo_ids):
+                    # 轮询验证订单是否存在，订单可查询后立即返回
+                    if self._wait_for_algo_ids(algo_ids):
                         write_echo("✅ 止盈止损订单验证成功")
                         return True
                     else:
@@ -853,29 +1137,45 @@ class OKXTradingExecutor:
                     write_error("止盈止损下单返回空结果")
                     
             except Exception as e:
-                write_error(f"止盈止损设置失败 (尝试 {attempt + 1}): {e}")
+                write_error("止盈止损设置失败 (尝试 %d): %s", attempt + 1, e)
             
-            # 如果不是最后一次尝试，等待后重试
+            # 如果不是最后一次尝试，指数退避后重试
             if attempt < max_retries - 1:
-                write_echo("等待5秒后重试...")
-                time.sleep(5)
+                wait_seconds = min(TP_SL_RETRY_MAX_WAIT,
+                                   TP_SL_RETRY_BASE_WAIT * 2 ** attempt + random.uniform(0, TP_SL_RETRY_BASE_WAIT))
+                write_echo("等待%.2f秒后重试...", wait_seconds)
+                time.sleep(wait_seconds)
         
         write_error("止盈止损设置达到最大重试次数，最终失败")
         return False
     
+    def _wait_for_algo_ids(self, algo_ids: Dict, timeout: float = ALGO_VERIFY_TIMEOUT) -> bool:
+        """指数退避轮询止盈止损订单，订单出现即返回True，超时返回False"""
+        deadline = time.monotonic() + timeout
+        delay = ALGO_VERIFY_INITIAL_DELAY
+        while True:
+            time.sleep(delay)
+            if self._verify_tp_sl_orders_exist(algo_ids):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            delay = min(delay * 2, ALGO_VERIFY_MAX_DELAY, remaining)
+    
     def _verify_tp_sl_orders_exist(self, algo_ids: Dict) -> bool:
         """验证止盈止损订单是否存在"""
         try:
-            algo_orders = self.dc.get_algo_orders()
+            # 轮询验证需要最新状态，不走查询缓存
+            algo_orders = self.dc.get_algo_orders(cache_ttl=0)
+            pending_ids = {order['algoId'] for order in algo_orders}
             
-            tp_exists = any(order['algoId'] == algo_ids['tp_algo_id'] for order in algo_orders)
-            sl_exists = any(order['algoId'] == algo_ids['sl_algo_id'] for order in algo_orders)
+            exists = pending_ids.issuperset(algo_ids.values())
             
-            write_echo(f"止盈单存在: {tp_exists}, 止损单存在: {sl_exists}")
-            return tp_exists and sl_exists
+            write_echo("止盈止损单存在: %s", exists)
+            return exists
             
         except Exception as e:
-            write_error(f"验证止盈止损订单失败: {e}")
+            write_error("验证止盈止损订单失败: %s", e)
             return False
     
     def _cancel_current_tp_sl_orders(self):
@@ -883,89 +1183,39 @@ class OKXTradingExecutor:
         try:
             if self.current_tp_sl_orders:
                 write_echo("撤销当前止盈止损订单...")
-                for algo_id in self.current_tp_sl_orders.values():
-                    self.dc.cancel_algo_order(algo_id)
+                self.dc.cancel_algo_orders(list(self.current_tp_sl_orders.values()))
                 self.current_tp_sl_orders = {}
                 write_echo("止盈止损订单撤销成功")
         except Exception as e:
             write_error(f"撤销止盈止损订单失败: {e}")
     
     def _place_tp_sl_order(self, pos_side: str, eth_size: float, tp_price: float, sl_price: float) -> Dict:
-        """下止盈止损单"""
+        """下止盈止损单：一个OCO算法单同时挂止盈和止损，一次请求完成，一边触发后另一边自动撤销"""
         try:
             endpoint = "/api/v5/trade/order-algo"
             
             # 确定止盈止损方向
-            if pos_side == "long":
-                # 多单：止损是卖出，止盈也是卖出
-                tp_params = {
-                    'instId': SYMBOL,
-                    'tdMode': 'cross',
-                    'side': 'sell',
-                    'ordType': 'conditional',
-                    'sz': self._convert_eth_to_contracts(eth_size),
-                    'tpTriggerPx': str(tp_price),
-                    'tpOrdPx': '-1',  # -1表示市价
-                    'posSide': 'long'
-                }
-                
-                sl_params = {
-                    'instId': SYMBOL,
-                    'tdMode': 'cross',
-                    'side': 'sell',
-                    'ordType': 'conditional',
-                    'sz': self._convert_eth_to_contracts(eth_size),
-                    'slTriggerPx': str(sl_price),
-                    'slOrdPx': '-1',  # -1表示市价
-                    'posSide': 'long'
-                }
-                
-            elif pos_side == "short":
-                # 空单：止损是买入，止盈也是买入
-                tp_params = {
-                    'instId': SYMBOL,
-                    'tdMode': 'cross',
-                    'side': 'buy',
-                    'ordType': 'conditional',
-                    'sz': self._convert_eth_to_contracts(eth_size),
-                    'tpTriggerPx': str(tp_price),
-                    'tpOrdPx': '-1',  # -1表示市价
-                    'posSide': 'short'
-                }
-                
-                sl_params = {
-                    'instId': SYMBOL,
-                    'tdMode': 'cross',
-                    'side': 'buy',
-                    'ordType': 'conditional',
-                    'sz': self._convert_eth_to_contracts(eth_size),
-                    'slTriggerPx': str(sl_price),
-                    'slOrdPx': '-1',  # -1表示市价
-                    'posSide': 'short'
-                }
-            else:
+            template = self._TP_SL_TEMPLATES.get(pos_side)
+            if template is None:
                 raise ValueError(f"无效的持仓方向: {pos_side}")
             
-            write_echo(f"止盈单参数: {tp_params}")
-            write_echo(f"止损单参数: {sl_params}")
+            params = {
+                **template,
+                'sz': self._convert_eth_to_contracts(eth_size),
+                'tpTriggerPx': _format_price(tp_price),
+                'slTriggerPx': _format_price(sl_price)
+            }
             
-            # 下止盈单
-            tp_result = self.dc._make_request('POST', endpoint, tp_params)
-            tp_algo_id = tp_result[0]['algoId']
-            write_echo(f"止盈单下单成功, AlgoID: {tp_algo_id}")
+            write_echo("止盈止损单参数: %s", params)
             
-            # 下止损单
-            sl_result = self.dc._make_request('POST', endpoint, sl_params)
-            sl_algo_id = sl_result[0]['algoId']
-            write_echo(f"止损单下单成功, AlgoID: {sl_algo_id}")
+            result = self.dc._make_request('POST', endpoint, params)
+            algo_id = result[0]['algoId']
+            write_echo("止盈止损单下单成功, AlgoID: %s", algo_id)
             
-            return {
-                'tp_algo_id': tp_algo_id,
-                'sl_algo_id': sl_algo_id
-            }
+            return {'algo_id': algo_id}
             
         except Exception as e:
-            write_error(f"下止盈止损单失败: {e}")
+            write_error("下止盈止损单失败: %s", e)
             raise
     
     def _place_order(self, action: str, eth_size: float) -> bool:
@@ -974,35 +1224,24 @@ class OKXTradingExecutor:
             endpoint = "/api/v5/trade/order"
             
             # 确定买卖方向
-            if action == "open_long":
-                side = "buy"
-                posSide = "long"
-            elif action == "open_short":
-                side = "sell" 
-                posSide = "short"
-            else:
+            template = self._OPEN_TEMPLATES.get(action)
+            if template is None:
                 raise ValueError(f"无效的开仓动作: {action}")
             
             # 将ETH数量转换为张数 (合约面值ctVal=0.1)
             contract_size = self._convert_eth_to_contracts(eth_size)
             
-            params = {
-                'instId': SYMBOL,
-                'tdMode': 'cross',
-                'side': side,
-                'ordType': 'market',
-                'sz': str(contract_size),
-                'lever': str(LEVERAGE),
-                'posSide': posSide  # 关键修复：添加持仓方向参数
-            }
+            params = {**template, 'sz': contract_size}
             
-            write_echo(f"下单参数: {params}")
+            write_echo("下单参数: %s", params)
+            self.last_order_id = None
             result = self.dc._make_request('POST', endpoint, params)
-            write_echo(f"下单成功: {side} {posSide} {eth_size} ETH ({contract_size}张)")
+            self.last_order_id = result[0].get('ordId')
+            write_echo("下单成功: %s %s %s ETH (%s张)", params['side'], params['posSide'], eth_size, contract_size)
             return True
             
         except Exception as e:
-            write_error(f"下单失败: {e}")
+            write_error("下单失败: %s", e)
             # 特定错误处理
             if "insufficient" in str(e).lower():
                 write_error("可能原因：账户余额不足")
@@ -1015,7 +1254,7 @@ class OKXTradingExecutor:
     def _close_position(self, action: str) -> bool:
         """平仓 - 仅用于测试"""
         try:
-            position_info = self.dc.get_position_info()
+            position_info = self.dc.get_position_info(cache_ttl=0)
             
             if position_info["position_size"] == 0:
                 write_echo("无持仓可平")
@@ -1024,55 +1263,45 @@ class OKXTradingExecutor:
             endpoint = "/api/v5/trade/order"
             
             # 根据平仓动作确定方向
-            if action == "close_long":  # 平多仓
-                side = "sell"
-                posSide = "long"
-            elif action == "close_short":  # 平空仓
-                side = "buy" 
-                posSide = "short"
-            else:
+            template = self._CLOSE_TEMPLATES.get(action)
+            if template is None:
                 raise ValueError(f"无效的平仓动作: {action}")
             
             # 将持仓的ETH数量转换为张数
             contract_size = self._convert_eth_to_contracts(position_info["position_size"])
             
-            params = {
-                'instId': SYMBOL,
-                'tdMode': 'cross',
-                'side': side,
-                'ordType': 'market',
-                'sz': str(contract_size),
-                'posSide': posSide  # 关键修复：添加持仓方向参数
-            }
+            params = {**template, 'sz': contract_size}
             
-            write_echo(f"平仓参数: {params}")
+            write_echo("平仓参数: %s", params)
             result = self.dc._make_request('POST', endpoint, params)
-            write_echo(f"平仓成功: {side} {posSide} {position_info['position_size']} ETH ({contract_size}张)")
+            write_echo("平仓成功: %s %s %s ETH (%s张)", params['side'], params['posSide'],
+                       position_info['position_size'], contract_size)
             return True
             
         except Exception as e:
-            write_error(f"平仓失败: {e}")
+            write_error("平仓失败: %s", e)
             return False
 
     def _convert_eth_to_contracts(self, eth_size: float) -> str:
-        """
-        将ETH数量转换为合约张数
-        根据诊断结果，合约面值ctVal=0.1，所以1张=0.1 ETH
-        最小下单数量minSz=0.01张
-        """
-        CONTRACT_VALUE = 0.1  # 每张合约代表的ETH数量
-        MIN_CONTRACT_SIZE = 0.01  # 最小下单张数
-        
-        # 计算张数
-        contracts = eth_size / CONTRACT_VALUE
-        
-        # 验证是否满足最小下单要求
-        if contracts < MIN_CONTRACT_SIZE:
-            raise ValueError(f"转换后的张数({contracts:.4f})小于最小要求({MIN_CONTRACT_SIZE})")
-        
-        # 格式化为字符串，保留小数点后2位（因为最小精度是0.01）
-        return f"{contracts:.2f}"
+        """将ETH数量转换为合约张数字符串"""
+        return _eth_to_contracts(eth_size)
 
+    def _await_position(self, expect_open: bool, timeout: float = POSITION_SETTLE_TIMEOUT,
+                        initial: float = POSITION_SETTLE_INITIAL_DELAY) -> bool:
+        """指数退避轮询持仓，直到有持仓(expect_open=True)或已平仓，超时返回False"""
+        deadline = time.monotonic() + timeout
+        delay = initial
+        while True:
+            position_info = self.dc.get_position_info(cache_ttl=0)
+            if (position_info["position_size"] > 0) == expect_open:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                write_echo("%.1f秒内持仓未达到预期状态", timeout)
+                return False
+            time.sleep(min(delay, remaining))
+            delay *= 2
+    
     def test_trading_module(self) -> bool:
         """测试交易模块 - 修复版本，包含止盈止损测试"""
         try:
@@ -1085,7 +1314,7 @@ class OKXTradingExecutor:
                 write_error("开多单测试失败")
                 return False
             write_echo("开多单成功")
-            time.sleep(3)
+            self._await_position(True)
             
             # 3.1.2 测试多单止盈止损模块
             write_echo("3.1.2 测试多单止盈止损模块...")
@@ -1111,7 +1340,6 @@ class OKXTradingExecutor:
                 write_error("多单止盈止损测试失败")
                 return False
             write_echo("多单止盈止损设置成功")
-            time.sleep(3)
             
             # 3.1.3 测试多单止盈止损模块，撤回当前多单止盈止损单
             write_echo("3.1.3 撤回多单止盈止损单...")
@@ -1125,7 +1353,7 @@ class OKXTradingExecutor:
                 write_error("平多单测试失败")
                 return False
             write_echo("平多单成功")
-            time.sleep(3)
+            self._await_position(False)
             
             # 3.3 测试开空单
             write_echo("3.3 测试开空单...")
@@ -1134,7 +1362,7 @@ class OKXTradingExecutor:
                 write_error("开空单测试失败")
                 return False
             write_echo("开空单成功")
-            time.sleep(3)
+            self._await_position(True)
             
             # 3.3.2 测试空单止盈止损模块
             write_echo("3.3.2 测试空单止盈止损模块...")
@@ -1160,7 +1388,6 @@ class OKXTradingExecutor:
                 write_error("空单止盈止损测试失败")
                 return False
             write_echo("空单止盈止损设置成功")
-            time.sleep(3)
             
             # 3.3.3 测试空单止盈止损模块，撤回当前空单止盈止损单
             write_echo("3.3.3 撤回空单止盈止损单...")
@@ -1258,17 +1485,14 @@ class TradingBotTester:
         """测试AI输入输出模块"""
         try:
             # 获取测试数据
-            klines = self.dc.get_kline_data()
-            current_price = klines[0]['close'] if klines else 0
+            klines, account_status, position_info = self.dc.fetch_cycle_data()
+            current_price = klines['close'][0] if klines['close'] else 0
             
             market_data = {
                 "current_price": current_price,
                 "kline_5min": klines
             }
             
-            account_status = self.dc.get_account_balance()
-            position_info = self.dc.get_position_info()
-            
             # 记录AI输入
             write_echo("=== AI输入数据 ===")
             input_data = {
@@ -1276,14 +1500,14 @@ class TradingBotTester:
                 "account_status": account_status,
                 "position_info": position_info
             }
-            write_echo(json.dumps(input_data, indent=2, ensure_ascii=False))
+            write_echo(json_dumps(input_data, indent=True))
             
             # 获取AI决策
             ai_decision = self.ai.get_trading_decision(market_data, account_status, position_info)
             
             # 记录AI输出
             write_echo("=== AI输出数据 ===")
-            write_echo(json.dumps(ai_decision, indent=2, ensure_ascii=False))
+            write_echo(json_dumps(ai_decision, indent=True))
             
             write_echo("AI输入输出模块测试成功")
             return True
@@ -1302,6 +1526,13 @@ class ETHTradingBot:
         self.trading_executor = OKXTradingExecutor(self.data_collector, self.ai_processor)
         self.tester = TradingBotTester(self.data_collector, self.ai_processor, self.trading_executor)
         
+        # 订单状态推送，收到后提前结束等待；未安装依赖时保持定时轮询
+        self.order_stream = OKXOrderStream(self.data_collector)
+        self.order_stream.start()
+        
+        # 预先完成与OKX的TLS握手并放入连接池，首笔下单不再承担建连延迟；失败只记录日志
+        self.data_collector.get_account_balance()
+        
         write_echo("交易机器人初始化完成")
     
     def run_tests(self) -> bool:
@@ -1322,22 +1553,16 @@ class ETHTradingBot:
             else:
                 write_echo("无挂单状态，进行AI决策")
                 
-                # 2. 收集市场数据
-                klines = self.data_collector.get_kline_data()
-                current_price = klines[0]['close'] if klines else 0
+                # 2-4. 并发收集市场数据、账户状态和持仓信息
+                klines, account_status, position_info = self.data_collector.fetch_cycle_data()
+                current_price = klines['close'][0] if klines['close'] else 0
                 
                 market_data = {
                     "current_price": current_price,
                     "kline_5min": klines
                 }
                 
-                write_echo(f"当前价格: {current_price:.2f} USDT")
-                
-                # 3. 获取账户状态
-                account_status = self.data_collector.get_account_balance()
-                
-                # 4. 获取持仓信息
-                position_info = self.data_collector.get_position_info()
+                write_echo("当前价格: %.2f USDT", current_price)
                 
                 # 5. AI决策
                 ai_decision = self.ai_processor.get_trading_decision(
@@ -1356,7 +1581,7 @@ class ETHTradingBot:
                 return AI_FREQUENCY  # 返回300秒后再次检查
             
         except Exception as e:
-            write_error(f"动态交易周期执行失败: {e}")
+            write_error("动态交易周期执行失败: %s", e)
             return AI_FREQUENCY  # 出错时返回正常频率
     
     def run_continuously(self):
@@ -1365,11 +1590,13 @@ class ETHTradingBot:
         
         while True:
             try:
-                # 执行动态周期并获取下次检查间隔
+                # 执行动态周期并获取下次检查间隔，周期内发生的推送同样会触发下一次提前检查
+                self.order_stream.changed.clear()
                 next_interval = self.run_dynamic_cycle()
                 
-                write_echo(f"等待 {next_interval} 秒后继续检查")
-                time.sleep(next_interval)
+                write_echo("等待 %s 秒后继续检查", next_interval)
+                if self.order_stream.wait(next_interval):
+                    write_echo("收到订单状态推送，提前检查")
                 
             except KeyboardInterrupt:
                 write_echo("程序被用户中断")
@@ -1387,6 +1614,10 @@ if __name__ == "__main__":
     write_echo(f"杠杆: {LEVERAGE}倍")
     write_echo(f"AI决策频率: {AI_FREQUENCY}秒")
     write_echo(f"挂单检查频率: {CHECK_PENDING_ORDERS_INTERVAL}秒")
+    # 签名走OpenSSL的SHA256实现，1.1.1+在支持SHA扩展的CPU上自动启用SHA-NI
+    write_echo(f"签名后端: {ssl.OPENSSL_VERSION}")
+    if ssl.OPENSSL_VERSION_INFO < (1, 1, 1):
+        write_error("OpenSSL版本低于1.1.1，HMAC-SHA256签名无法使用SHA-NI硬件加速")
     
     # 运行测试流程
     if bot.run_tests():